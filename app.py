@@ -7,14 +7,57 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.alert import Alert
+from selenium.common.exceptions import NoSuchWindowException
 import re
 import os
+import json
+import math
+import enum
+from array import array
+import itertools
+import time
+import functools
+import gzip
+import heapq
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Mapping
+from urllib.parse import urlparse, parse_qsl, urljoin
+import shutil
+import urllib3
 import dotenv
+import lxml.html
+from history import MissionHistory
 
 dotenv.load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+BASE_URL = os.getenv("LSS_BASE_URL", "https://www.leitstellenspiel.de").rstrip("/")
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Leer gesetzte Variablen (z.B. "SCHEDULER_WEIGHTS=" in einer .env) gelten wie bei env_flag als nicht gesetzt
+def env_number(name, default, cast=float):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return cast(default)
+    return cast(value)
+
+def env_json(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return json.loads(value)
+
 VEHICLE_MAPPINGS = {
     "Dekon-P": "Dekon-P",
     "Drehleiter": "DLK",
@@ -108,26 +151,159 @@ PARTIAL_MATCHES = {
     "streifenwagen": "FuStW",
     "GW-Mess": "GW-M",
 }
-def smart_vehicle_match(vehicle_name):
-    if vehicle_name.lower().startswith("hlf"):
-        return "HLF 20"
-    # ich glaube man sieht, dass ich faul bin, sry X.x   
-    # **Hust** handle_lf_and_rw_requirements Funktion **Hust**    
-    if vehicle_name in VEHICLE_MAPPINGS:
-        return VEHICLE_MAPPINGS[vehicle_name]
-    vehicle_lower = vehicle_name.lower()
-    for partial, abbrev in PARTIAL_MATCHES.items():
-        if partial in vehicle_lower:
-            return abbrev
-    if "-" in vehicle_name:
-        abbrev_parts = vehicle_name.split("-")
-        possible_matches = [v for v in VEHICLE_MAPPINGS.values() if v.startswith(abbrev_parts[0])]
+class VehicleResolver:
+    # Wird einmal beim Start aus VEHICLE_MAPPINGS/PARTIAL_MATCHES gebaut und liefert
+    # dieselben Ergebnisse wie die alte smart_vehicle_match, nur ohne jedes Mal alles abzusuchen.
+    def __init__(self, mappings, partial_matches, memo_size=1024):
+        self.mappings = dict(mappings)
+        self.names = list(self.mappings.keys())
+        self.abbreviations = frozenset(self.mappings.values())
+        # Reihenfolge ist wichtig: der erste passende Teilstring gewinnt
+        self.partials = list(partial_matches.items())
+        self.prefixes = {}
+        for abbrev in self.mappings.values():
+            for i in range(len(abbrev) + 1):
+                self.prefixes.setdefault(abbrev[:i], abbrev)
+        self.memo = OrderedDict()
+        self.memo_size = memo_size
+        self.lock = threading.Lock()
+        self.metrics = {"memo": 0, "hlf": 0, "exact": 0, "partial": 0, "prefix": 0, "fuzzy": 0, "unmatched": 0}
+
+    def lookup(self, vehicle_name):
+        if vehicle_name.lower().startswith("hlf"):
+            return "hlf", "HLF 20"
+        # ich glaube man sieht, dass ich faul bin, sry X.x   
+        # **Hust** SUBSTITUTIONS **Hust**    
+        if vehicle_name in self.mappings:
+            return "exact", self.mappings[vehicle_name]
+        vehicle_lower = vehicle_name.lower()
+        for partial, abbrev in self.partials:
+            if partial in vehicle_lower:
+                return "partial", abbrev
+        if "-" in vehicle_name:
+            abbrev = self.prefixes.get(vehicle_name.split("-")[0])
+            if abbrev is not None:
+                return "prefix", abbrev
+        possible_matches = get_close_matches(vehicle_name, self.names, n=1, cutoff=0.6)
         if possible_matches:
-            return possible_matches[0]
-    possible_matches = get_close_matches(vehicle_name, VEHICLE_MAPPINGS.keys(), n=1, cutoff=0.6)
-    if possible_matches:
-        return VEHICLE_MAPPINGS[possible_matches[0]]
-    return vehicle_name
+            return "fuzzy", self.mappings[possible_matches[0]]
+        return "unmatched", vehicle_name
+
+    def resolve(self, vehicle_name):
+        with self.lock:
+            if vehicle_name in self.memo:
+                self.memo.move_to_end(vehicle_name)
+                self.metrics["memo"] += 1
+                return self.memo[vehicle_name]
+        tier, result = self.lookup(vehicle_name)
+        if tier == "fuzzy":
+            logging.info(f"Fuzzy vehicle match: '{vehicle_name}' -> '{result}'")
+        with self.lock:
+            self.metrics[tier] += 1
+            self.memo[vehicle_name] = result
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return result
+
+VEHICLE_RESOLVER = VehicleResolver(VEHICLE_MAPPINGS, PARTIAL_MATCHES)
+
+def smart_vehicle_match(vehicle_name):
+    return VEHICLE_RESOLVER.resolve(vehicle_name)
+
+# Fester Index pro Fahrzeugtyp: alles, was smart_vehicle_match liefern kann
+VehicleType = enum.IntEnum(
+    "VehicleType", [(name, i) for i, name in enumerate(sorted(VEHICLE_RESOLVER.abbreviations | {"HLF 20"}))]
+)
+VEHICLE_NAMES = [vehicle_type.name for vehicle_type in VehicleType]
+VEHICLE_INDEX = {name: i for i, name in enumerate(VEHICLE_NAMES)}
+NO_VEHICLES = array("i", [0]) * len(VEHICLE_NAMES)
+
+class VehicleCounts(Mapping):
+    # Fahrzeuganzahl pro Typ als int-Array über VehicleType, Typen außerhalb der Enum (z.B. nicht
+    # erkannte Namen aus der Fahrzeugtabelle) in extra. Liest sich wie ein dict, ist aber unveränderlich:
+    # at_least/added/replace liefern ein neues Objekt, niemand verändert fremde Anforderungen.
+    __slots__ = ("counts", "extra")
+
+    def __init__(self, counts=None, extra=None):
+        self.counts = counts if counts is not None else array("i", NO_VEHICLES)
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, mapping):
+        if isinstance(mapping, VehicleCounts):
+            return mapping
+        counts = array("i", NO_VEHICLES)
+        extra = {}
+        for name, count in mapping.items():
+            index = VEHICLE_INDEX.get(name)
+            if index is not None:
+                counts[index] += count
+            elif count:
+                extra[name] = extra.get(name, 0) + count
+        return cls(counts, extra)
+
+    def get(self, name, default=0):
+        index = VEHICLE_INDEX.get(name)
+        value = self.counts[index] if index is not None else self.extra.get(name, 0)
+        return value or default
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if not value:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return bool(self.get(name))
+
+    def __iter__(self):
+        for index, count in enumerate(self.counts):
+            if count:
+                yield VEHICLE_NAMES[index]
+        for name, count in self.extra.items():
+            if count:
+                yield name
+
+    def __len__(self):
+        return sum(1 for count in self.counts if count) + sum(1 for count in self.extra.values() if count)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def replace(self, name, value):
+        index = VEHICLE_INDEX.get(name)
+        if index is None:
+            return VehicleCounts(self.counts, dict(self.extra, **{name: value}))
+        counts = array("i", self.counts)
+        counts[index] = value
+        return VehicleCounts(counts, self.extra)
+
+    def at_least(self, name, value):
+        return self if self.get(name) >= value else self.replace(name, value)
+
+    def added(self, name, value):
+        return self.replace(name, self.get(name) + value)
+
+    def __sub__(self, other):
+        # Fehlbestand: elementweise a - b, nicht unter 0
+        other = VehicleCounts.from_dict(other)
+        counts = array("i", [a - b if a > b else 0 for a, b in zip(self.counts, other.counts)])
+        extra = {name: count - other.extra.get(name, 0) for name, count in self.extra.items()
+                 if count > other.extra.get(name, 0)}
+        return VehicleCounts(counts, extra)
+
+    def __add__(self, other):
+        other = VehicleCounts.from_dict(other)
+        counts = array("i", [a + b for a, b in zip(self.counts, other.counts)])
+        extra = dict(self.extra)
+        for name, count in other.extra.items():
+            extra[name] = extra.get(name, 0) + count
+        return VehicleCounts(counts, extra)
+
+# Alles, was ein Durchlauf über einen Einsatz weiß, bevor geplant wird
+MissionSnapshot = namedtuple("MissionSnapshot", [
+    "present", "enroute_personnel", "required", "min_patients", "nef_probability", "credits",
+])
 
 def extract_vehicle_type(vehicle_cell):
     if '(' not in vehicle_cell or ')' not in vehicle_cell:
@@ -153,55 +329,428 @@ def extract_vehicle_type(vehicle_cell):
     
     return raw_type
 
-def extract_current_vehicles(driver):
-    current_vehicles = {}
-    enroute_personnel = 0
-    sleep(0.125)
+class Metrics:
+    # Zeitmessung pro Phase (tab_open, help_page, ...). Jeder Span landet als Zeile in einer
+    # JSONL-Datei, die letzten Werte pro Phase werden für p50/p95/p99 im Speicher gehalten.
+    def __init__(self, path=None, window=1000, rate_window=300):
+        self.path = None
+        self.window = window
+        self.rate_window = rate_window
+        self.durations = {}
+        self.totals = {}
+        self.missions = deque()
+        self.missions_total = 0
+        self.gauges = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.file = None
+        self.server = None
+        self.open(path)
+
+    def open(self, path):
+        # Erst in main(), damit ein import app keine Datei im Arbeitsverzeichnis anlegt
+        if not path or self.file is not None:
+            return
+        try:
+            self.file = open(path, "a", encoding="utf-8", buffering=1)
+            self.path = path
+        except Exception as e:
+            logging.warning(f"Could not open metrics file: {e}")
+
+    @contextmanager
+    def span(self, phase):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - start)
+
+    def timed(self, phase):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(phase):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def collect(self):
+        # Sammelt zusätzlich alle Spans des aktuellen Threads (z.B. eines Einsatz-Durchlaufs) pro Phase
+        phases = {}
+        self.local.phases = phases
+        try:
+            yield phases
+        finally:
+            self.local.phases = None
+
+    def record(self, phase, duration):
+        phases = getattr(self.local, "phases", None)
+        if phases is not None:
+            phases[phase] = round(phases.get(phase, 0.0) + duration, 4)
+        with self.lock:
+            self.durations.setdefault(phase, deque(maxlen=self.window)).append(duration)
+            count, total = self.totals.get(phase, (0, 0.0))
+            self.totals[phase] = (count + 1, total + duration)
+            # Unter dem Lock, damit sich Zeilen paralleler Worker nicht vermischen
+            if self.file:
+                try:
+                    self.file.write(json.dumps({"ts": time.time(), "phase": phase, "duration": round(duration, 4)}) + "\n")
+                except Exception as e:
+                    logging.warning(f"Could not write metrics: {e}")
+
+    def mission_done(self):
+        now = time.monotonic()
+        with self.lock:
+            self.missions.append(now)
+            self.missions_total += 1
+            while self.missions and now - self.missions[0] > self.rate_window:
+                self.missions.popleft()
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def checkpoint(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                "missions_total": self.missions_total,
+                "mission_ages": [now - t for t in self.missions],
+                "counters": dict(self.counters),
+            }
+
+    def restore(self, state):
+        now = time.monotonic()
+        with self.lock:
+            self.missions_total += state.get("missions_total", 0)
+            self.missions.extend(now - age for age in state.get("mission_ages", []) if age <= self.rate_window)
+            for name, value in (state.get("counters") or {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def missions_per_minute(self):
+        now = time.monotonic()
+        with self.lock:
+            recent = [t for t in self.missions if now - t <= self.rate_window]
+        return len(recent) * 60.0 / self.rate_window
+
+    @staticmethod
+    def quantile(sorted_values, q):
+        if not sorted_values:
+            return 0.0
+        # Nearest-rank
+        index = max(0, math.ceil(q * len(sorted_values)) - 1)
+        return sorted_values[index]
+
+    def summary(self):
+        with self.lock:
+            phases = {phase: sorted(values) for phase, values in self.durations.items()}
+            totals = dict(self.totals)
+        result = {}
+        for phase, values in phases.items():
+            result[phase] = {
+                "p50": self.quantile(values, 0.5),
+                "p95": self.quantile(values, 0.95),
+                "p99": self.quantile(values, 0.99),
+                "count": totals[phase][0],
+                "sum": totals[phase][1],
+            }
+        return result
+
+    def prometheus(self):
+        lines = [
+            "# HELP lss_phase_seconds Duration of mission pass phases.",
+            "# TYPE lss_phase_seconds summary",
+        ]
+        for phase, stats in sorted(self.summary().items()):
+            for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                value = stats[key]
+                lines.append(f'lss_phase_seconds{{phase="{phase}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'lss_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+            lines.append(f'lss_phase_seconds_sum{{phase="{phase}"}} {stats["sum"]:.6f}')
+        lines.append("# TYPE lss_missions_per_minute gauge")
+        lines.append(f"lss_missions_per_minute {self.missions_per_minute():.3f}")
+        lines.append("# TYPE lss_missions_total counter")
+        lines.append(f"lss_missions_total {self.missions_total}")
+        with self.lock:
+            gauges = sorted(self.gauges.items())
+            counters = sorted(self.counters.items())
+        for name, value in gauges:
+            lines.append(f"# TYPE lss_{name} gauge")
+            lines.append(f"lss_{name} {value:.3f}")
+        for name, value in counters:
+            lines.append(f"# TYPE lss_{name} counter")
+            lines.append(f"lss_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            logging.warning(f"Could not start metrics endpoint on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+        return server
+
+# Dateien (METRICS_FILE, HISTORY_DB) öffnet erst main(), bis dahin wird nur im Speicher gezählt
+METRICS = Metrics()
+
+MISSION_HISTORY = MissionHistory(None)
+
+# Datensatz des laufenden Einsatz-Durchlaufs (pro Thread), landet am Ende in MISSION_HISTORY
+PASS_CONTEXT = threading.local()
+
+def note_pass(**fields):
+    record = getattr(PASS_CONTEXT, "record", None)
+    if record is not None:
+        record.update(fields)
+
+def note_dispatch(vehicle_type, requested, selected):
+    record = getattr(PASS_CONTEXT, "record", None)
+    if record is not None:
+        record["dispatches"].append((vehicle_type, requested, selected))
+
+class PageRecorder:
+    # Aufnahme-Modus (RECORD_DIR): das HTML, das ein Durchlauf gelesen hat (Einsatz, Hilfeseite,
+    # Krankenhausliste, Gefangenen-Link), landet gzip-komprimiert unter <dir>/<mission_id>/<pass>.json.gz,
+    # zusammen mit den live getroffenen Entscheidungen. replay.py spielt den Korpus ohne Browser ab.
+    def __init__(self, directory):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.passes = {}
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def mission_dir(self, mission_id):
+        return os.path.join(self.directory, re.sub(r'[^\w\-]', '_', str(mission_id)))
+
+    def next_pass(self, mission_dir):
+        with self.lock:
+            if mission_dir not in self.passes:
+                existing = os.listdir(mission_dir) if os.path.isdir(mission_dir) else []
+                self.passes[mission_dir] = len([name for name in existing if name.endswith(".json.gz")])
+            self.passes[mission_dir] += 1
+            return self.passes[mission_dir]
+
+    def save(self, record):
+        if not self.enabled or not record.get("pages"):
+            return
+        mission_dir = self.mission_dir(record["mission_id"])
+        try:
+            os.makedirs(mission_dir, exist_ok=True)
+            pass_number = self.next_pass(mission_dir)
+            entry = {key: record.get(key) for key in (
+                "mission_id", "mission_type", "caption", "started_at", "status",
+                "required", "present", "planned", "dispatches", "pages",
+            )}
+            entry["pass"] = pass_number
+            path = os.path.join(mission_dir, f"{pass_number:04d}.json.gz")
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            self.saved += 1
+        except Exception as e:
+            logging.warning(f"Could not record mission pass: {e}")
+
+RECORDER = PageRecorder(os.getenv("RECORD_DIR"))
+
+def note_page(kind, url, page):
+    record = getattr(PASS_CONTEXT, "record", None)
+    if not RECORDER.enabled or record is None or page is None:
+        return
+    if not isinstance(page, str):
+        page = lxml.html.tostring(page, encoding="unicode")
+    record.setdefault("pages", []).append({"kind": kind, "url": url, "html": page})
+
+WAIT_STATS = {}
+WAIT_STATS_LOCK = threading.Lock()
+
+def record_wait(name, elapsed, satisfied):
+    with WAIT_STATS_LOCK:
+        stats = WAIT_STATS.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0})
+        stats["count"] += 1
+        stats["total"] += elapsed
+        stats["max"] = max(stats["max"], elapsed)
+        if not satisfied:
+            stats["timeouts"] += 1
+
+def wait_for(driver, name, condition, timeout, poll=0.05):
+    # Wartet auf eine benannte Bedingung statt fest zu schlafen und merkt sich, wie lange es gedauert hat.
+    # Ein Timeout ist kein Fehler: der Aufrufer macht einfach weiter, wie früher nach dem sleep().
+    start = time.monotonic()
+    satisfied = True
     try:
-        driving_table = driver.find_element(By.ID, 'mission_vehicle_driving')
-        rows = driving_table.find_elements(By.TAG_NAME, 'tr')
-        for row in rows[1:]:
-            cells = row.find_elements(By.TAG_NAME, 'td')
-            if len(cells) >= 3:
-                vehicle_cell = cells[1].text
-                personnel_text = cells[2].text.strip()
-                if '(' in vehicle_cell and ')' in vehicle_cell:
-                    raw_type = extract_vehicle_type(vehicle_cell)
-                    matched_type = smart_vehicle_match(raw_type)
-                    current_vehicles[matched_type] = current_vehicles.get(matched_type, 0) + 1
-                if personnel_text.isdigit():
-                    enroute_personnel += int(personnel_text)
-    except Exception as e:
-        logging.error(f"error reading coming vehicles | no vehicles on route")
-    
-    sleep(0.5)
+        WebDriverWait(driver, timeout, poll_frequency=poll).until(condition)
+    except Exception:
+        satisfied = False
+    elapsed = time.monotonic() - start
+    record_wait(name, elapsed, satisfied)
+    if not satisfied:
+        logging.info(f"Wait '{name}' timed out after {elapsed:.2f}s")
+    return satisfied
+
+def wait_for_ready_state(driver, timeout=10):
+    return wait_for(
+        driver, "ready_state",
+        lambda d: d.execute_script("return document.readyState") == "complete",
+        timeout,
+    )
+
+def wait_for_element(driver, locator, timeout=10, name="element"):
+    return wait_for(driver, name, EC.presence_of_element_located(locator), timeout)
+
+DOM_MUTATION_SCRIPT = """
+if (!window.__lssObserver) {
+    window.__lssLastMutation = Date.now();
+    window.__lssObserver = new MutationObserver(function () { window.__lssLastMutation = Date.now(); });
+    window.__lssObserver.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+return Date.now() - window.__lssLastMutation;
+"""
+
+def wait_for_dom_quiet(driver, quiet=0.15, timeout=3):
+    # Fertig, sobald das DOM `quiet` Sekunden lang nicht mehr verändert wurde
+    return wait_for(
+        driver, "dom_quiet",
+        lambda d: d.execute_script(DOM_MUTATION_SCRIPT) >= quiet * 1000,
+        timeout,
+    )
+
+def wait_for_element_count_change(driver, locator, previous_count, timeout, name="element_count"):
+    return wait_for(
+        driver, name,
+        lambda d: len(d.find_elements(*locator)) != previous_count,
+        timeout, poll=0.5,
+    )
+
+def wait_for_alarm_response(driver, alarm_button, timeout=6):
+    # Nach dem Alarm-Klick lädt das Missionsfenster neu (oder es kommt ein Alert),
+    # erst dann ist die Alarmierung beim Server angekommen.
+    start = time.monotonic()
+    responded = wait_for(
+        driver, "alarm_response",
+        lambda d: EC.alert_is_present()(d) or EC.staleness_of(alarm_button)(d),
+        timeout,
+    )
+    if responded and not EC.alert_is_present()(driver):
+        wait_for_ready_state(driver, timeout=max(0.5, timeout - (time.monotonic() - start)))
+    return responded
+
+MISSION_VEHICLES_SCRIPT = """
+function readTable(id, minCells) {
+    var table = document.getElementById(id);
+    if (!table) { return null; }
+    var rows = Array.prototype.slice.call(table.querySelectorAll('tr'), 1);
+    var result = [];
+    rows.forEach(function (row) {
+        var cells = row.querySelectorAll('td');
+        if (cells.length >= minCells) {
+            result.push({
+                vehicle: cells[1].innerText,
+                personnel: cells.length >= 3 ? cells[2].innerText : ''
+            });
+        }
+    });
+    return result;
+}
+return {
+    driving: readTable('mission_vehicle_driving', 3),
+    at_mission: readTable('mission_vehicle_at_mission', 2)
+};
+"""
+
+def snapshot_mission_vehicles(driver):
+    # Ein einziger Round-Trip für beide Tabellen statt einem pro Zeile/Zelle
     try:
-        at_mission_table = driver.find_element(By.ID, 'mission_vehicle_at_mission')
-        rows = at_mission_table.find_elements(By.TAG_NAME, 'tr')
-        for row in rows[1:]:
-            cells = row.find_elements(By.TAG_NAME, 'td')
-            if len(cells) >= 2:
-                vehicle_cell = cells[1].text
-                logging.info(f"Vehicle cell: {vehicle_cell}")
-                if '(' in vehicle_cell and ')' in vehicle_cell:
-                    raw_type = extract_vehicle_type(vehicle_cell)
-                    matched_type = smart_vehicle_match(raw_type)
-                    current_vehicles[matched_type] = current_vehicles.get(matched_type, 0) + 1
+        return driver.execute_script(MISSION_VEHICLES_SCRIPT)
     except Exception as e:
+        logging.error(f"Error taking mission vehicle snapshot: {str(e)}")
+        return {"driving": None, "at_mission": None}
+
+def count_current_vehicles(snapshot):
+    counts = array("i", NO_VEHICLES)
+    extra = {}
+    def count(matched_type):
+        index = VEHICLE_INDEX.get(matched_type)
+        if index is not None:
+            counts[index] += 1
+        else:
+            extra[matched_type] = extra.get(matched_type, 0) + 1
+    enroute_personnel = 0
+    driving = snapshot.get("driving")
+    if driving is None:
+        logging.error(f"error reading coming vehicles | no vehicles on route")
+    for row in driving or []:
+        vehicle_cell = row["vehicle"]
+        personnel_text = row["personnel"].strip()
+        if '(' in vehicle_cell and ')' in vehicle_cell:
+            count(smart_vehicle_match(extract_vehicle_type(vehicle_cell)))
+        if personnel_text.isdigit():
+            enroute_personnel += int(personnel_text)
+
+    at_mission = snapshot.get("at_mission")
+    if at_mission is None:
         logging.error(f"Error reading vehicles at mission | no vehicles at mission")
-    
-    sleep(0.25)
-    return current_vehicles, enroute_personnel
+    for row in at_mission or []:
+        vehicle_cell = row["vehicle"]
+        logging.info(f"Vehicle cell: {vehicle_cell}")
+        if '(' in vehicle_cell and ')' in vehicle_cell:
+            count(smart_vehicle_match(extract_vehicle_type(vehicle_cell)))
+    return VehicleCounts(counts, extra), enroute_personnel
 
-def extract_vehicle_requirements(table):
+def extract_current_vehicles(driver):
+    wait_for_ready_state(driver)
+    return count_current_vehicles(snapshot_mission_vehicles(driver))
+
+PatientRequirements = namedtuple("PatientRequirements", ["min_patients", "nef_probability"])
+# needs: pro Patient die angeforderten Fahrzeuge, totals: Fahrzeug -> Anzahl Patienten,
+# training: (Anzahl, Ausbildung) aus der Meldung über fehlende Fahrzeuge
+PatientScan = namedtuple("PatientScan", ["count", "needs", "totals", "training"])
+AlertRules = namedtuple("AlertRules", ["pattern", "vehicles"])
+HelpPage = namedtuple("HelpPage", ["vehicles", "min_patients", "nef_probability", "credits"])
+
+def parse_html(html):
+    return lxml.html.fromstring(html)
+
+def by_class(*classes):
+    # XPath-Ersatz für CSS-Klassenselektoren wie ".alert.alert-danger"
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in classes)
+
+def node_text(node):
+    # Entspricht ungefähr WebElement.text: Whitespace zusammengefasst
+    return " ".join(node.text_content().split())
+
+def first(nodes):
+    return nodes[0] if nodes else None
+
+def parse_vehicle_requirements(table):
     requirements = {}
-    rows = table.find_elements(By.TAG_NAME, 'tr')
-    for row in rows:
+    for row in table.iter('tr'):
         try:
-            cells = row.find_elements(By.TAG_NAME, 'td')
+            cells = row.xpath('.//td')
             if len(cells) == 2:
-                vehicle_text = cells[0].text.strip()
-                value_text = cells[1].text.strip()
+                vehicle_text = node_text(cells[0])
+                value_text = node_text(cells[1])
                 if "anforderungswahrscheinlichkeit" in vehicle_text.lower():
                     continue
                 if "Feuerwehrleute" in vehicle_text:
@@ -226,7 +775,7 @@ def extract_vehicle_requirements(table):
                     matched_vehicle = smart_vehicle_match(vehicle_text)
                     try:
                         count = int(value_text)
-                        if matched_vehicle in VEHICLE_MAPPINGS.values():
+                        if matched_vehicle in VEHICLE_RESOLVER.abbreviations:
                             requirements[matched_vehicle] = max(requirements.get(matched_vehicle, 0), count)
                     except ValueError:
                         continue
@@ -234,172 +783,530 @@ def extract_vehicle_requirements(table):
             logging.error(f"Error extracting requirements: {str(e)}")
     return requirements
 
-def extract_actual_patients(driver):
+def parse_patient_requirements(info_div):
+    min_patients = 0
+    nef_probability = 0
+    try:
+        info_table = first(info_div.xpath('.//table'))
+        if info_table is None:
+            raise ValueError("no patient info table")
+        for row in info_table.iter('tr'):
+            cells = row.xpath('.//td')
+            if len(cells) == 2:
+                label = node_text(cells[0]).lower()
+                value = node_text(cells[1])
+                if "mindest patientenanzahl" in label:
+                    min_patients = int(value)
+                elif "nef anforderungswahrscheinlichkeit" in label:
+                    nef_probability = int(value)
+    except Exception as e:
+        logging.error(f"Error extracting patient requirements: {str(e)}")
+    return PatientRequirements(min_patients, nef_probability)
+
+def parse_mission_credits(info_div):
+    # "Credits im Durchschnitt" steht in der ersten Spalte der Hilfeseite
+    for row in info_div.iter('tr'):
+        cells = row.xpath('.//td')
+        if len(cells) == 2 and "credits" in node_text(cells[0]).lower():
+            digits = re.sub(r'\D', '', node_text(cells[1]))
+            if digits:
+                return int(digits)
+    return 0
+
+def parse_help_page(tree):
+    col_md_4_divs = tree.xpath(f"//*[{by_class('col-md-4')}]")
+    if len(col_md_4_divs) < 2:
+        return None
+    credits = parse_mission_credits(col_md_4_divs[0])
+    requirements_table = first(col_md_4_divs[1].xpath('.//table'))
+    required_vehicles = parse_vehicle_requirements(requirements_table) if requirements_table is not None else {}
+    patients = PatientRequirements(0, 0)
+    if len(col_md_4_divs) >= 3:
+        patients = parse_patient_requirements(col_md_4_divs[2])
+    return HelpPage(VehicleCounts.from_dict(required_vehicles), patients.min_patients, patients.nef_probability, credits)
+
+def parse_patient_snapshot(tree):
+    # Gegenstück zu PATIENT_SCAN_SCRIPT
+    patients = [
+        [node_text(alert) for alert in div.xpath(f".//*[{by_class('alert-danger')}]")]
+        for div in tree.xpath(f"//*[{by_class('mission_patient')}]")
+    ]
+    alert_div = first(tree.xpath(f"//*[{by_class('alert-missing-vehicles')}]"))
+    return {"patients": patients, "missing_vehicles": node_text(alert_div) if alert_div is not None else None}
+
+# Meldung bei einem Patienten (regulärer Ausdruck) -> anzuforderndes Fahrzeug. Jede Regel zählt pro
+# Patient höchstens einmal. Überschreiben per PATIENT_ALERT_RULES='[["Tragehilfe", "LF"], ...]'.
+PATIENT_ALERT_RULES = [
+    ("NEF", "NEF"),
+    ("Tragehilfe", "LF"),
+    ("OrgL", "KdoW OrgL"),
+    ("LNA", "KdoW LNA"),
+]
+
+TRAINING_PATTERN = re.compile(r'(\d+)\s+Person(?:en)?\s+mit\s+([\w\s\-\(\)]+)-Ausbildung', re.IGNORECASE)
+
+def compile_alert_rules(rules):
+    # Alle Regeln in einem Ausdruck, eine benannte Gruppe pro Regel: ein finditer pro Meldung
+    if not rules:
+        return AlertRules(re.compile(r'(?!)'), [])
+    pattern = "|".join(f"(?P<rule{i}>{expression})" for i, (expression, _) in enumerate(rules))
+    return AlertRules(re.compile(pattern), [vehicle for _, vehicle in rules])
+
+PATIENT_ALERTS = compile_alert_rules(env_json("PATIENT_ALERT_RULES", PATIENT_ALERT_RULES))
+
+def classify_patients(snapshot, rules=PATIENT_ALERTS):
+    needs = []
+    totals = {}
+    for alerts in snapshot.get("patients") or []:
+        patient = set()
+        for text in alerts:
+            for match in rules.pattern.finditer(text or ""):
+                patient.add(rules.vehicles[int(match.lastgroup[len("rule"):])])
+        for vehicle_type in patient:
+            totals[vehicle_type] = totals.get(vehicle_type, 0) + 1
+        needs.append(tuple(sorted(patient)))
+    training = [
+        (int(match.group(1)), match.group(2).strip())
+        for match in TRAINING_PATTERN.finditer(snapshot.get("missing_vehicles") or "")
+    ]
+    return PatientScan(len(needs), needs, totals, training)
+
+def parse_vehicle_table(tree, table_id, min_cells):
+    # Gegenstück zu readTable() in MISSION_VEHICLES_SCRIPT
+    table = first(tree.xpath(f"//*[@id='{table_id}']"))
+    if table is None:
+        return None
+    rows = []
+    for row in table.xpath('.//tr')[1:]:
+        cells = row.xpath('.//td')
+        if len(cells) >= min_cells:
+            rows.append({"vehicle": node_text(cells[1]), "personnel": node_text(cells[2]) if len(cells) >= 3 else ''})
+    return rows
+
+def parse_mission_vehicles(tree):
+    return {
+        "driving": parse_vehicle_table(tree, 'mission_vehicle_driving', 3),
+        "at_mission": parse_vehicle_table(tree, 'mission_vehicle_at_mission', 2),
+    }
+
+def parse_aao_index(tree):
+    # Gegenstück zu AAO_INDEX_SCRIPT/build_aao_index
+    index = {}
+    for link in tree.xpath(f"//*[{by_class('aao_searchable')}]"):
+        span = first(link.xpath(".//span[starts-with(@id, 'available_aao_')]"))
+        available = None
+        success = None
+        if span is not None:
+            match = re.match(r'\s*(-?\d+)', span.text_content())
+            available = int(match.group(1)) if match else None
+            success = "label-success" in (span.get("class") or "").split()
+        attribute = link.get("search_attribute")
+        index.setdefault(attribute, {"attribute": attribute, "available": available, "success": success})
+    return index
+
+def parse_missing_personnel(tree):
+    alert_div = first(tree.xpath(f"//*[{by_class('alert-missing-vehicles')}]"))
+    if alert_div is None:
+        return 0
+    personnel_div = first(alert_div.xpath(".//div[@data-requirement-type='personnel']"))
+    if personnel_div is None:
+        return 0
+    text = node_text(personnel_div)
+    logging.info(f"Found missing personnel div text: '{text}'")
+    match = re.search(r'(\d+)\s+Feuerwehrleute', text)
+    if match:
+        return int(match.group(1))
+    if "Feuerwehrmann" in text:
+        return 1
+    return 0
+
+def parse_missing_water(tree):
+    missing_div = first(tree.xpath(f"//*[{by_class('progress-bar-missing', 'progress-bar-mission-window-water')}]"))
+    if missing_div is None:
+        logging.warning(f"No missing water div found or there is an error")
+        return 0
+    return parse_missing_water_text(node_text(missing_div))
+
+def parse_missing_water_text(text):
+    # z.B. "Fehlen: 3.500 l."
+    logging.info(f"Found missing water div text: '{text}'")
+    match = re.search(r'Fehlen:\s*([\-\d\.]+)\s*l\.', text)
+    if match:
+        missing_value = float(match.group(1).replace('.', ''))
+        logging.info(f"Parsed missing water: {missing_value}")
+        return missing_value
+    return 0  # Kein Wasser benötigt lol
+
+def element_tree(element):
+    return parse_html(element.get_attribute('outerHTML'))
+
+def page_tree(driver):
+    return parse_html(driver.page_source)
+
+def extract_vehicle_requirements(table):
+    return parse_vehicle_requirements(element_tree(table))
+
+PATIENT_SCAN_SCRIPT = """
+var patients = Array.prototype.map.call(document.querySelectorAll('.mission_patient'), function (patient) {
+    return Array.prototype.map.call(patient.querySelectorAll('.alert-danger'), function (alert) {
+        return alert.innerText;
+    });
+});
+var missing = document.querySelector('.alert-missing-vehicles');
+return {patients: patients, missing_vehicles: missing ? missing.innerText : null};
+"""
+
+def extract_patients(driver):
+    # Alle Patientenmeldungen und die Fehlend-Meldung in einem Script-Aufruf
     wait = WebDriverWait(driver, 10)
     try:
-        container = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "#col_left, .col-lg-6")))
-        patient_divs = container.find_elements(By.CSS_SELECTOR, ".mission_patient")
+        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "#col_left, .col-lg-6")))
     except Exception as e:
-        print("Exception in extract_actual_patients:", e)
-        patient_divs = driver.find_elements(By.CSS_SELECTOR, ".mission_patient")
-    actual_count = len(patient_divs)
-    nef_needed = 0
-    for div in patient_divs:
-        try:
-            alert_div = div.find_element(By.CSS_SELECTOR, ".alert-danger")
-            if "NEF" in alert_div.text:
-                nef_needed += 1
-        except:
-            pass
-    logging.info(f"Actual patients: {actual_count} - NEF needed: {nef_needed}")
-    return actual_count, nef_needed
+        logging.warning(f"Mission page not ready for patient scan: {e}")
+    try:
+        snapshot = driver.execute_script(PATIENT_SCAN_SCRIPT) or {}
+    except Exception as e:
+        logging.error(f"Error scanning patients: {str(e)}")
+        snapshot = {}
+    scan = classify_patients(snapshot)
+    logging.info(f"Actual patients: {scan.count} - needs: {scan.totals}")
+    return scan
 
 def extract_patient_requirements(col_md_4_divs):
-    min_patients = 0
-    nef_probability = 0
     if len(col_md_4_divs) >= 3:
         try:
-            info_div = col_md_4_divs[2]
-            info_table = info_div.find_element(By.TAG_NAME, 'table')
-            rows = info_table.find_elements(By.TAG_NAME, 'tr')
-            for row in rows:
-                cells = row.find_elements(By.TAG_NAME, 'td')
-                if len(cells) == 2:
-                    label = cells[0].text.strip().lower()
-                    value = cells[1].text.strip()
-                    if "mindest patientenanzahl" in label:
-                        min_patients = int(value)
-                    elif "nef anforderungswahrscheinlichkeit" in label:
-                        nef_probability = int(value)
+            return parse_patient_requirements(element_tree(col_md_4_divs[2]))
         except Exception as e:
             logging.error(f"Error extracting patient requirements: {str(e)}")
-    return min_patients, nef_probability
-
-def extract_missing_personnel(driver):
-    try:
-        alert_div = driver.find_element(By.CLASS_NAME, 'alert-missing-vehicles')
-        personnel_div = alert_div.find_element(By.CSS_SELECTOR, 'div[data-requirement-type="personnel"]')
-        text = personnel_div.text.strip()
-        match = re.search(r'(\d+)\s+Feuerwehrleute', text)
-        logging.info(f"Found missing personnel div text: '{text}'")
-        if match:
-            number = int(match.group(1))
-            return number
-        if "Feuerwehrmann" in text:
-            return 1
-    except:
-        return 0
+    return PatientRequirements(0, 0)
 
 def extract_missing_water(driver):
+    # Nur der Wasserbalken statt der ganzen Seite, für das Nachlesen nach einer Auswahl
     try:
-        missing_div = driver.find_element(By.CSS_SELECTOR, ".progress-bar-missing.progress-bar-mission-window-water")
-        text = missing_div.text  # z.B. "Fehlen: 3.500 l."
-        logging.info(f"Found missing water div text: '{text}'")
-        match = re.search(r'Fehlen:\s*([\-\d\.]+)\s*l\.', text)
-        if match:
-            missing_value = float(match.group(1).replace('.', ''))
-            logging.info(f"Parsed missing water: {missing_value}")
-            return missing_value
+        bars = driver.find_elements(By.CSS_SELECTOR, ".progress-bar-missing.progress-bar-mission-window-water")
+        if bars:
+            return parse_missing_water_text(" ".join((bars[0].get_attribute("textContent") or "").split()))
     except Exception as e:
-        logging.warning(f"No missing water div found or there is an error")
-        # logging.error(f"Error extracting missing water: {str(e)}")
-    return 0  # Kein Wasser benötigt lol
+        logging.warning(f"Could not read missing water: {e}")
+        return 0
+    logging.warning(f"No missing water div found or there is an error")
+    return 0
 
-def handle_lf_and_rw_requirements(required_vehicles, current_vehicles):
-    current_hfl = current_vehicles.get("HLF 20", 0)
-    required_rw = required_vehicles.get("RW", 0)
-    required_lf = required_vehicles.get("LF", 0)
+REQUIREMENTS_CACHE_VERSION = 2
 
-    if current_hfl > required_rw:
-        reduction = min(current_hfl, required_rw)
-        required_vehicles.pop("RW", None)
-        current_hfl -= reduction
-        logging.info(f"RW requirements are already satisfied by {reduction} HLF 20.")
-    else:
-        required_vehicles["RW"] -= current_hfl
-        current_hfl = 0
-        logging.info("RW requirement are not fully met by HLF 20.")
-        
-    if current_hfl > 0 and required_lf > 0:
-        reduction = min(current_hfl, required_lf)
-        required_lf -= reduction
-        required_vehicles["LF"] = max(0, required_lf)
-        current_hfl -= reduction
-        logging.info(f"LF requirement reduced by {reduction} HLF 20.")
-
-    current_vehicles.pop("HLF 20", None)
-    logging.info(f"new required vehicles: {required_vehicles}")
-    logging.info(required_vehicles)
-    return required_vehicles, current_vehicles
+class RequirementsCache:
+    # Die Hilfeseite eines Einsatztyps ändert sich nie, also merken wir uns die Anforderungen
+    # pro Einsatztyp im Speicher (LRU) und auf der Platte (überlebt Neustarts).
+    def __init__(self, path, max_entries=256, ttl=7 * 24 * 3600, version=REQUIREMENTS_CACHE_VERSION):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.memory = OrderedDict()
+        self.disk = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self.load()
+
+    @staticmethod
+    def key_for(help_url):
+        # z.B. "/einsaetze/42?mission_id=123" -> "42" (mission_id ist pro Einsatz, nicht pro Typ)
+        parsed = urlparse(help_url or "")
+        mission_type = parsed.path.rstrip("/").rsplit("/", 1)[-1]
+        extra = sorted((k, v) for k, v in parse_qsl(parsed.query) if k != "mission_id")
+        if extra:
+            mission_type += "?" + "&".join(f"{k}={v}" for k, v in extra)
+        return mission_type
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self.disk = data.get("entries", {})
+            else:
+                logging.info("Requirements cache version changed, starting with an empty cache")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not load requirements cache: {e}")
+
+    def save(self):
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "entries": self.disk}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.warning(f"Could not save requirements cache: {e}")
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, help_url):
+        key = self.key_for(help_url)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None:
+                entry = self.disk.get(key)
+            if entry is None or time.time() - entry["stored_at"] > self.ttl:
+                self.memory.pop(key, None)
+                self.disk.pop(key, None)
+                self.misses += 1
+                return None
+            self.remember(key, entry)
+            self.hits += 1
+        return HelpPage(
+            VehicleCounts.from_dict(entry["vehicles"]), entry["min_patients"], entry["nef_probability"], entry["credits"]
+        )
+
+    def peek(self, mission_type):
+        # Nur nachschlagen (für die Priorisierung), ohne Treffer/LRU/TTL anzufassen
+        with self.lock:
+            return self.memory.get(mission_type) or self.disk.get(mission_type)
+
+    def put(self, help_url, required_vehicles, min_patients, nef_probability, credits=0):
+        key = self.key_for(help_url)
+        entry = {
+            "vehicles": dict(required_vehicles),
+            "min_patients": min_patients,
+            "nef_probability": nef_probability,
+            "credits": credits,
+            "stored_at": time.time(),
+        }
+        with self.lock:
+            self.remember(key, entry)
+            self.disk[key] = entry
+            self.save()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.disk)}
+
+REQUIREMENTS_CACHE = RequirementsCache(
+    os.getenv("REQUIREMENTS_CACHE_FILE", "requirements_cache.json"),
+    ttl=env_number("REQUIREMENTS_CACHE_TTL", 7 * 24 * 3600),
+)
+
+class ReadOnlyClient:
+    # Schlanker HTTP-Client (urllib3, kommt mit Selenium) für reine Lese-Seiten: Hilfeseite,
+    # Krankenhausliste, Einsatz-abgeschlossen-Check. Cookies und User-Agent kommen aus dem Browser,
+    # die Verbindungen bleiben offen. Liefert None, wenn etwas nicht passt, dann übernimmt der Browser.
+    def __init__(self, base_url, enabled=True, maxsize=8, timeout=10):
+        self.base_url = base_url
+        self.enabled = enabled
+        self.timeout = timeout
+        self.http = urllib3.PoolManager(maxsize=maxsize, block=False, retries=urllib3.Retry(1, redirect=False))
+        self.headers = None
+        self.requests = 0
+        self.failures = 0
+
+    def sync_from(self, driver):
+        if not self.enabled:
+            return
+        try:
+            cookies = driver.get_cookies()
+            user_agent = driver.execute_script("return navigator.userAgent")
+            self.headers = {
+                "Cookie": "; ".join(f"{c['name']}={c['value']}" for c in cookies),
+                "User-Agent": user_agent,
+                "Accept": "text/html",
+            }
+        except Exception as e:
+            logging.warning(f"Could not copy session to HTTP client: {e}")
+            self.headers = None
+
+    def get(self, url):
+        if not self.enabled or self.headers is None or not url:
+            return None
+        absolute = urljoin(self.base_url + "/", url)
+        # Der Session-Cookie geht nur an BASE_URL, nie an fremde Links oder Redirect-Ziele
+        if urlparse(absolute)[:2] != urlparse(self.base_url)[:2]:
+            logging.warning(f"Not reading {url} via HTTP: not on {self.base_url}")
+            return None
+        self.requests += 1
+        try:
+            response = self.http.request(
+                "GET", absolute, headers=self.headers,
+                timeout=self.timeout, redirect=False,
+            )
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f"HTTP read of {url} failed: {e}")
+            return None
+        if response.status != 200:
+            # Redirect auf /users/sign_in heißt: Sitzung abgelaufen, der Browser macht's
+            self.failures += 1
+            return None
+        return response.data.decode("utf-8", errors="replace")
+
+    def tree(self, url):
+        html = self.get(url)
+        if html is None:
+            return None
+        try:
+            return parse_html(html)
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f"Could not parse {url}: {e}")
+            return None
+
+    def stats(self):
+        return {"requests": self.requests, "failures": self.failures}
+
+READ_CLIENT = ReadOnlyClient(BASE_URL, enabled=env_flag("READ_VIA_HTTP", True))
+
+class TabManager:
+    # Wenige langlebige Tabs mit festen Rollen: "main" (Leitstelle), "mission" (aktueller Einsatz) und
+    # "aux" (Hilfeseite, Krankenhaus, Gefangene, Aufgaben). Statt window.open/close wird im Tab navigiert.
+    # Welcher Handle zu welcher Rolle gehört, steht in self.roles; alles andere ist ein Leck und wird von
+    # check() geschlossen, ohne die eigenen Tabs anzufassen.
+    def __init__(self, driver):
+        self.driver = driver
+        self.roles = {"main": driver.current_window_handle}
+        self.current = "main"
+        self.created = 0
+        self.navigations = 0
+        self.leaked = 0
+        self.lost = 0
+
+    def switch(self, role):
+        handle = self.roles.get(role)
+        if handle is not None:
+            try:
+                self.driver.switch_to.window(handle)
+                self.current = role
+                return handle
+            except NoSuchWindowException:
+                logging.warning(f"Tab '{role}' was closed, opening a new one")
+                self.lost += 1
+                del self.roles[role]
+        self.driver.switch_to.new_window("tab")
+        handle = self.roles[role] = self.driver.current_window_handle
+        self.created += 1
+        self.current = role
+        if getattr(self.driver, "block_resources", False):
+            # Network.setBlockedURLs gilt pro Tab, bei langlebigen Tabs reicht einmal
+            block_heavy_resources(self.driver)
+        return handle
+
+    def open(self, role, url):
+        self.switch(role)
+        self.driver.get(url)
+        self.navigations += 1
+
+    @contextmanager
+    def visit(self, role, url):
+        # Kurz in einem anderen Tab arbeiten und danach zurück, z.B. Hilfeseite aus dem Einsatz heraus
+        previous = self.current
+        self.open(role, url)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def check(self):
+        # Leck-Erkennung: fremde Handles (z.B. von target=_blank) schließen, verschwundene Rollen vergessen
+        handles = self.driver.window_handles
+        for role, handle in list(self.roles.items()):
+            if handle not in handles:
+                self.lost += 1
+                del self.roles[role]
+        owned = set(self.roles.values())
+        leaks = [handle for handle in handles if handle not in owned]
+        if "main" not in self.roles and leaks:
+            # Leitstelle verloren: ein vorhandenes Tab übernehmen statt ein neues zu öffnen
+            self.roles["main"] = leaks.pop(0)
+        for handle in leaks:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        if leaks:
+            self.leaked += len(leaks)
+            METRICS.increment("tabs_leaked_total", len(leaks))
+            logging.warning(f"Closed {len(leaks)} unmanaged tab(s)")
+        self.switch("main")
+        return len(leaks)
+
+    def stats(self):
+        return {
+            "tabs": len(self.roles), "created": self.created, "navigations": self.navigations,
+            "leaked": self.leaked, "lost": self.lost,
+        }
+
+def tabs_for(driver):
+    manager = getattr(driver, "tab_manager", None)
+    if manager is None:
+        manager = driver.tab_manager = TabManager(driver)
+    return manager
+
+def fetch_mission_requirements(driver, wait, help_url):
+    with tabs_for(driver).visit("aux", help_url):
+        wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'col-md-4')))
+        tree = page_tree(driver)
+    note_page("help", help_url, tree)
+    return parse_help_page(tree)
+
+def get_mission_requirements(driver, wait, help_url):
+    # Beim Aufnehmen die Hilfeseite immer lesen, damit jeder Durchlauf für sich abspielbar ist
+    requirements = None if RECORDER.enabled else REQUIREMENTS_CACHE.get(help_url)
+    if requirements is not None:
+        logging.info(f"Requirements cache hit for mission type {REQUIREMENTS_CACHE.key_for(help_url)}")
+        return requirements
+    requirements = None
+    tree = READ_CLIENT.tree(help_url)
+    if tree is not None:
+        requirements = parse_help_page(tree)
+        if requirements is not None:
+            note_page("help", help_url, tree)
+    if requirements is None:
+        requirements = fetch_mission_requirements(driver, wait, help_url)
+    if requirements is not None:
+        REQUIREMENTS_CACHE.put(help_url, *requirements)
+    return requirements
 
 def handle_patients_and_nef(driver, required_vehicles, current_vehicles, enroute_personnel, min_patients, nef_probability):
+    # Anforderungen plus Patientenzahl für MISSION_SCHEDULER (nicht die RTW-Anforderung, die ist schon
+    # um Vorhandenes und NAW gekürzt)
+    scan = extract_patients(driver)
+    required_vehicles = plan_patient_vehicles(
+        required_vehicles, current_vehicles, enroute_personnel, min_patients, nef_probability, scan
+    )
+    return required_vehicles, count_patients(min_patients, scan)
+
+def count_patients(min_patients, scan):
+    return max(min_patients, scan.count)
+
+def plan_patient_vehicles(required_vehicles, current_vehicles, enroute_personnel, min_patients, nef_probability, scan):
     if enroute_personnel is None:
         enroute_personnel = 0
-    actual_count, nef_in_divs = extract_actual_patients(driver)
-    final_patient_count = max(min_patients, actual_count)
+    nef_in_divs = scan.totals.get("NEF", 0)
+    final_patient_count = count_patients(min_patients, scan)
+    # Absolute Anforderungen; was schon da ist (auch NAW als RTW/NEF) rechnet plan_dispatch heraus
+    required_vehicles = VehicleCounts.from_dict(required_vehicles)
+    if final_patient_count > 0:
+        required_vehicles = required_vehicles.at_least("RTW", final_patient_count)
     current_nef = current_vehicles.get("NEF", 0) + current_vehicles.get("NAW", 0)
-    current_rtw = current_vehicles.get("RTW", 0)
-    needed_rtw = max(0, final_patient_count - current_rtw)
-    needed_nef_total = max(0, nef_in_divs - current_nef)
-    needed_nef = 1 if needed_nef_total > 0 else 0
-
-    if needed_rtw > 0 and needed_nef > 0:
-        current_naw = current_vehicles.get("NAW", 0)
-        if current_naw < 1:
-            required_vehicles["NAW"] = required_vehicles.get("NAW", 0) + 1
-            logging.info("Alarming one NAW for RTW + NEF requirements (only 1 NEF needed per pass).")
-            needed_rtw = 0
-            needed_nef = 0
-        else:
-            required_vehicles["RTW"] = required_vehicles.get("RTW", 0) + needed_rtw
-            required_vehicles["NEF"] = required_vehicles.get("NEF", 0) + needed_nef
-            logging.info(f"Alarming {needed_rtw} RTW + {needed_nef} NEF (only 1 NEF needed per pass).")
-            needed_rtw = 0
-            needed_nef = 0
-    elif needed_rtw > 0:
-        required_vehicles["RTW"] = required_vehicles.get("RTW", 0) + needed_rtw
-    elif needed_nef > 0:
-        required_vehicles["NEF"] = required_vehicles.get("NEF", 0) + needed_nef
-    
-    if needed_nef > 0 and current_nef > 0:
+    if nef_in_divs > current_nef:
+        # nur ein NEF pro Durchlauf
+        required_vehicles = required_vehicles.at_least("NEF", current_nef + 1)
+        logging.info(f"{nef_in_divs} patient(s) need a NEF, {current_nef} NEF/NAW present, requesting one more.")
+    elif nef_in_divs > 0:
         logging.info("NEF requirement already met by NEF/NAW on route.")
 
     if final_patient_count > 10 and "SEG" not in current_vehicles:
-        required_vehicles["ELW 1 (SEG)"] = 1
+        required_vehicles = required_vehicles.replace("ELW 1 (SEG)", 1)
 
-    lna_needed = False
-    orgl_needed = False
-    tragehilfe_needed = False
-    try:
-        patient_divs = driver.find_elements(By.CSS_SELECTOR, ".mission_patient")
-        for patient in patient_divs:
-            try:
-                alert_div = patient.find_element(By.CSS_SELECTOR, ".alert.alert-danger")
-                if "Tragehilfe" in alert_div.text:
-                    tragehilfe_needed = True
-                if "OrgL" in alert_div.text:
-                    orgl_needed = True
-                    if "LNA" in alert_div.text and lna_needed == True:
-                        break
-                if "LNA" in alert_div.text:
-                    lna_needed = True
-                    break
-            except:
-                continue
-    except Exception as e:
-        logging.error(f"Error checking LNA requirement: {str(e)}")
-    if lna_needed:
-        if current_vehicles.get("KdoW LNA", 0) < 1:
-            logging.info("LNA requirement found. Dispatching 1 KdoW LNA.")
-            required_vehicles["KdoW LNA"] = 1
-    if tragehilfe_needed:
-        if current_vehicles.get("LF", 0) < 1:
-            logging.info("Tragehilfe requirement found. Dispatching 1 LF.")
-            required_vehicles["LF"] = 1
-    if orgl_needed:
-        if current_vehicles.get("KdoW OrgL", 0) < 1:
-            logging.info("OrgL requirement found. Dispatching 1 KdoW OrgL.")
-            required_vehicles["KdoW OrgL"] = 1
+    # Alles außer NEF: ein Fahrzeug pro Einsatz, egal wie viele Patienten es brauchen
+    for vehicle_type, patient_count in sorted(scan.totals.items()):
+        if vehicle_type == "NEF":
+            continue
+        if current_vehicles.get(vehicle_type, 0) < 1:
+            logging.info(f"{patient_count} patient(s) need a {vehicle_type}. Dispatching 1 {vehicle_type}.")
+        required_vehicles = required_vehicles.at_least(vehicle_type, 1)
     """            
     try:
         missing_personnel = extract_missing_personnel(driver)
@@ -415,152 +1322,557 @@ def handle_patients_and_nef(driver, required_vehicles, current_vehicles, enroute
         logging.info(f"Missing personnel: {missing_personnel}, dispatching {lf_needed} LF")
     """
     try:
-        alert = driver.find_element(By.CSS_SELECTOR, ".alert-missing-vehicles")
-        alert_text = alert.text.strip()
-        training_match = re.search(r'(\d+)\s+Person(?:en)?\s+mit\s+([\w\s\-\(\)]+)-Ausbildung', alert_text, re.IGNORECASE)
-        if training_match:
-            count_training = int(training_match.group(1))
-            training_type = training_match.group(2).strip()
+        for count_training, training_type in scan.training:
             mapped_type = smart_vehicle_match(training_type)
             current_training = current_vehicles.get(mapped_type, 0)
             if current_training < count_training:
-                required_vehicles[mapped_type] = max(required_vehicles.get(mapped_type, 0), count_training)
+                required_vehicles = required_vehicles.at_least(mapped_type, count_training)
                 logging.info(f"Dispatching {mapped_type} for missing personnel with training: {training_type}")
     except Exception as e:
         logging.error(f"Error checking personnel training requirement: {str(e)}")
 
     return required_vehicles
 
-def calculate_missing_vehicles(required_vehicles, current_vehicles):
-    missing_vehicles = {}
-    
-    current_hfl = current_vehicles.get("HLF 20", 0)
-    required_rw = required_vehicles.get("RW", 0)
-    required_lf = required_vehicles.get("LF", 0)
-
-    if current_hfl and required_rw:
-        if current_hfl > required_rw:
-            reduction = min(current_hfl, required_rw)
-            required_vehicles.pop("RW", None)
-            current_hfl -= reduction
-            logging.info(f"RW requirements are already satisfied by {reduction} HLF 20.")
-        else:
-            required_vehicles["RW"] = required_rw - current_hfl
-            current_hfl = 0
-            logging.info("RW requirement are not fully met by HLF 20.")
-
-    if current_hfl > 0 and required_lf > 0:
-        reduction = min(current_hfl, required_lf)
-        required_lf -= reduction
-        required_vehicles["LF"] = max(0, required_lf)
-        current_hfl -= reduction
-        logging.info(f"LF requirement reduced by {reduction} HLF 20.")
-
-    for vehicle_type, required_count in required_vehicles.items():
-        if vehicle_type in ["RW", "LF"]: 
-            if required_count > 0: 
-                current_count = current_vehicles.get(vehicle_type, 0)
-                if required_count > current_count:
-                    needed = required_count - current_count
-                    missing_vehicles[vehicle_type] = needed
+# Welche Fahrzeuge andere ersetzen können. Eine Einheit übernimmt genau eine Zeile,
+# deckt dann aber alle Typen dieser Zeile gleichzeitig ab (NAW = RTW + NEF).
+SUBSTITUTIONS = [
+    ("HLF 20", {"RW": 1}),
+    ("HLF 20", {"LF": 1}),
+    ("NAW", {"RTW": 1, "NEF": 1}),
+]
+
+# Kosten pro alarmiertem Fahrzeug, Standard 1
+DISPATCH_COSTS = {}
+UNMET_PENALTY = 1000
+
+DispatchPlan = namedtuple("DispatchPlan", ["vehicles", "unmet", "cost"])
+
+def cover_with_present(deficits, required_vehicles, current_vehicles, substitutions):
+    # Überzählige vorhandene Fahrzeuge (z.B. HLF 20, NAW) auf offene Anforderungen verteilen
+    for vehicle in dict.fromkeys(row[0] for row in substitutions):
+        spare = current_vehicles.get(vehicle, 0) - required_vehicles.get(vehicle, 0)
+        rows = [covers for row_vehicle, covers in substitutions if row_vehicle == vehicle]
+        for _ in range(max(0, spare)):
+            best = max(rows, key=lambda covers: sum(min(deficits.get(t, 0), n) for t, n in covers.items()))
+            if not any(deficits.get(t, 0) for t in best):
+                break
+            for t, n in best.items():
+                if deficits.get(t, 0):
+                    deficits[t] = max(0, deficits[t] - n)
+                    logging.info(f"{t} requirement partly covered by present {vehicle}.")
+    return deficits
+
+def fill_deficits(deficits, remaining, substitutions, costs):
+    # Einzelne Einheiten, günstigste Option zuerst, bei Gleichstand das direkte Fahrzeug
+    plan = {}
+    cost = 0.0
+    for vehicle_type in list(deficits):
+        options = [(vehicle_type, {vehicle_type: 1})]
+        options += [(vehicle, covers) for vehicle, covers in substitutions if vehicle_type in covers]
+        options.sort(key=lambda option: (costs.get(option[0], 1.0), option[0] != vehicle_type))
+        for vehicle, covers in options:
+            while deficits[vehicle_type] > 0 and remaining.get(vehicle, 0) > 0:
+                remaining[vehicle] -= 1
+                plan[vehicle] = plan.get(vehicle, 0) + 1
+                cost += costs.get(vehicle, 1.0)
+                for t, n in covers.items():
+                    if t in deficits:
+                        deficits[t] = max(0, deficits[t] - n)
+    return plan, cost
+
+def plan_dispatch(required_vehicles, current_vehicles, available=None, substitutions=SUBSTITUTIONS, costs=DISPATCH_COSTS):
+    # Anforderungen minus Vorhandenes -> günstigster Alarmierungsplan in einem Schritt.
+    # available=None heißt: Verfügbarkeit unbekannt, alles gilt als verfügbar.
+    required_vehicles = VehicleCounts.from_dict(required_vehicles)
+    current_vehicles = VehicleCounts.from_dict(current_vehicles)
+    deficits = dict((required_vehicles - current_vehicles).items())
+    deficits = cover_with_present(deficits, required_vehicles, current_vehicles, substitutions)
+    deficits = {t: n for t, n in deficits.items() if n > 0}
+    if not deficits:
+        return DispatchPlan(VehicleCounts(), {}, 0.0)
+
+    vehicles = set(deficits) | {vehicle for vehicle, _ in substitutions}
+    if available is None:
+        availability = {vehicle: sum(deficits.values()) for vehicle in vehicles}
+    else:
+        availability = {vehicle: max(0, available.get(vehicle, 0)) for vehicle in vehicles}
+
+    # Bündel (ein Fahrzeug deckt mehrere Typen) durchprobieren, den Rest einzeln auffüllen
+    bundles = [(vehicle, covers) for vehicle, covers in substitutions
+               if len(covers) > 1 and any(t in deficits for t in covers)]
+    ranges = [
+        range(min(availability.get(vehicle, 0), max(deficits.get(t, 0) for t in covers)) + 1)
+        for vehicle, covers in bundles
+    ]
+    best = None
+    for counts in itertools.product(*ranges):
+        remaining = dict(availability)
+        left = dict(deficits)
+        plan = {}
+        cost = 0.0
+        feasible = True
+        for (vehicle, covers), count in zip(bundles, counts):
+            if count > remaining.get(vehicle, 0):
+                feasible = False
+                break
+            if count:
+                remaining[vehicle] -= count
+                plan[vehicle] = plan.get(vehicle, 0) + count
+                cost += count * costs.get(vehicle, 1.0)
+                for t, n in covers.items():
+                    if t in left:
+                        left[t] = max(0, left[t] - n * count)
+        if not feasible:
+            continue
+        filled, fill_cost = fill_deficits(left, remaining, substitutions, costs)
+        for vehicle, count in filled.items():
+            plan[vehicle] = plan.get(vehicle, 0) + count
+        unmet = {t: n for t, n in left.items() if n > 0}
+        score = (cost + fill_cost + UNMET_PENALTY * sum(unmet.values()), sum(plan.values()))
+        if best is None or score < best[0]:
+            best = (score, DispatchPlan(plan, unmet, cost + fill_cost))
+    result = best[1]
+    # Nicht abdeckbares trotzdem anfordern, select_vehicles überspringt es notfalls
+    vehicles_to_send = VehicleCounts.from_dict(result.vehicles) + result.unmet
+    return DispatchPlan(vehicles_to_send, result.unmet, result.cost)
+
+def aao_availability(required_vehicles, aao_index, substitutions=SUBSTITUTIONS):
+    if not aao_index:
+        return None
+    available = {}
+    for vehicle_type in set(required_vehicles) | {vehicle for vehicle, _ in substitutions}:
+        attribute = resolve_aao_attribute(vehicle_type, aao_index)
+        entry = aao_index.get(attribute) if attribute else None
+        if entry is None or entry["success"] is False:
+            available[vehicle_type] = 0
+        elif entry["available"] is None:
+            available[vehicle_type] = sum(required_vehicles.values()) or 1
         else:
-            current_count = current_vehicles.get(vehicle_type, 0)
-            if required_count > current_count:
-                needed = required_count - current_count
-                missing_vehicles[vehicle_type] = needed
+            available[vehicle_type] = entry["available"]
+    return available
 
-    logging.info(f"Final missing vehicles: {missing_vehicles}")
-    return missing_vehicles
+def calculate_missing_vehicles(required_vehicles, current_vehicles, available=None):
+    plan = plan_dispatch(required_vehicles, current_vehicles, available)
+    if plan.unmet:
+        logging.info(f"Not coverable with available vehicles: {plan.unmet}")
+    logging.info(f"Final missing vehicles: {plan.vehicles}")
+    return plan.vehicles
 
-def set_mission_speed(driver, desired_speed):
-    current_speed = None
+MISSION_SPEED_SCRIPT = """
+var done = arguments[arguments.length - 1];
+fetch('/missionSpeed?speed=' + encodeURIComponent(arguments[0]), {credentials: 'same-origin'})
+    .then(function (response) { done(response.ok); }, function () { done(false); });
+"""
+
+def read_mission_speed(driver):
     try:
         pause_element = driver.find_element(By.ID, 'mission_speed_pause')
         if pause_element.value_of_css_property("display") == "flex":
-            current_speed = "pause"
-        else:
-            current_speed = "other"
+            return "pause"
     except:
-        current_speed = "other"
-    if desired_speed == "pause" and current_speed != "pause":
-        driver.execute_script("window.open('/missionSpeed?speed=6','_blank')")
-        driver.switch_to.window(driver.window_handles[-1])
-        sleep(0.125)
-        driver.close()
-        driver.switch_to.window(driver.window_handles[0])
-    elif current_speed == "pause" and desired_speed != "pause":
-        driver.execute_script(f"window.open('/missionSpeed?speed={desired_speed}','_blank')")
-        driver.switch_to.window(driver.window_handles[-1])
-        sleep(0.125)
-        driver.close()
-        driver.switch_to.window(driver.window_handles[0])
+        pass
+    return "other"
 
-def select_vehicles(driver, required_vehicles, alarm_after_selection=True):
-    selected_any = False
-    for vehicle_type, count in required_vehicles.items():
-        logging.info(f"Preparing to select {count} vehicle(s) of type '{vehicle_type}'")
-        vehicle_links = driver.find_elements(By.CLASS_NAME, 'aao_searchable')
-        matched_link = None
-        sleep(0.037)
-        for link in vehicle_links:
-            if link.get_attribute('search_attribute') == vehicle_type:
-                matched_link = link
-                break
-        if not matched_link:
-            search_attributes = [link.get_attribute('search_attribute') for link in vehicle_links]
-            closest_match = get_close_matches(vehicle_type, search_attributes, n=1, cutoff=0.5)
-            if closest_match:
-                for link in vehicle_links:
-                    if link.get_attribute('search_attribute') == closest_match[0]:
-                        matched_link = link
-                        break
-        sleep(0.0625)
-        if matched_link:
-            for _ in range(count):
-                try:
-                    availability_span = matched_link.find_element(By.XPATH, ".//span[starts-with(@id,'available_aao_')]")
-                    if "label-success" in availability_span.get_attribute("class"):
-                        matched_link.click()
-                        selected_any = True
-                        logging.info(f"Selected vehicle: {vehicle_type}")
-                    else:
-                        logging.info(f"No vehicles available for {vehicle_type}. Skipping.")
-                        break
-                except Exception as e:
-                    logging.warning(f"No availability info for {vehicle_type}: {e}")
-                sleep(0.0625)
+def set_mission_speed(driver, desired_speed):
+    # Gleiche Anfrage wie der Link im Spiel, aber per fetch aus der Leitstelle statt über ein neues Tab
+    speed = "6" if desired_speed == "pause" else desired_speed
+    try:
+        return bool(driver.execute_async_script(MISSION_SPEED_SCRIPT, speed))
+    except Exception as e:
+        logging.warning(f"Could not set mission speed to {desired_speed}: {e}")
+        return False
+
+class CycleController:
+    # Regelt Spielgeschwindigkeit und Wartezeit zwischen den Zyklen anhand von Rückstand und Durchsatz.
+    # Pausiert wird ab pause_above offenen Einsätzen (oder wenn der Rückstand länger als max_drain Minuten
+    # zum Abarbeiten bräuchte), weiter geht es erst wieder ab resume_below, dazwischen bleibt alles wie es
+    # ist. Die zuletzt gesetzte Geschwindigkeit wird gemerkt, eine Anfrage geht nur bei einer Änderung raus.
+    def __init__(self, pause_above=13, resume_below=8, normal_speed="2", min_poll=2, max_poll=20, max_drain=10):
+        self.pause_above = pause_above
+        self.resume_below = resume_below
+        self.normal_speed = normal_speed
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.max_drain = max_drain
+        self.speed = None
+        self.rate = None
+        self.poll_interval = max_poll
+
+    def reset(self):
+        # Neuer Browser/neue Sitzung: Geschwindigkeit beim nächsten Zyklus wieder von der Seite lesen
+        self.speed = None
+
+    def checkpoint(self):
+        return {"rate": self.rate, "poll_interval": self.poll_interval}
+
+    def restore(self, state):
+        self.rate = state.get("rate")
+        self.poll_interval = state.get("poll_interval", self.poll_interval)
+
+    def drain_minutes(self, backlog):
+        if not backlog or not self.rate:
+            return 0.0
+        return backlog / self.rate
+
+    def desired_speed(self, backlog):
+        if backlog >= self.pause_above:
+            return "pause"
+        if backlog <= self.resume_below:
+            return self.normal_speed
+        if self.drain_minutes(backlog) > self.max_drain:
+            return "pause"
+        return self.speed
+
+    def apply_speed(self, driver, backlog):
+        if self.speed is None:
+            current = read_mission_speed(driver)
+            self.speed = "pause" if current == "pause" else None
+        desired = self.desired_speed(backlog)
+        METRICS.gauge("cycle_backlog", backlog)
+        if desired is None or desired == self.speed:
+            return
+        if set_mission_speed(driver, desired):
+            logging.info(f"Mission speed set to {desired} (backlog {backlog})")
+            self.speed = desired
+            METRICS.increment("mission_speed_changes_total")
+            METRICS.gauge("mission_speed_paused", 1 if desired == "pause" else 0)
+
+    def update(self, processed, deferred, seconds):
+        # Durchsatz als gleitender Mittelwert (Einsätze pro Minute), nur über Zyklen mit Arbeit
+        if processed and seconds > 0:
+            rate = processed * 60.0 / seconds
+            self.rate = rate if self.rate is None else 0.7 * self.rate + 0.3 * rate
+        if deferred:
+            # Zeitbudget aufgebraucht, Rest sofort weiter abarbeiten
+            self.poll_interval = 0
+        elif processed:
+            self.poll_interval = self.min_poll
         else:
-            logging.warning(f"Could not find vehicle: {vehicle_type}")
+            # Nichts zu tun: Wartezeit verdoppeln, eine Änderung der Seitenleiste weckt trotzdem früher auf
+            self.poll_interval = min(self.max_poll, max(self.min_poll, self.poll_interval * 2))
+        METRICS.gauge("cycle_poll_interval_seconds", self.poll_interval)
+        METRICS.gauge("cycle_missions_per_minute", self.rate or 0.0)
+        return self.poll_interval
+
+CYCLE_CONTROLLER = CycleController(
+    pause_above=env_number("SPEED_PAUSE_ABOVE", 13, int),
+    resume_below=env_number("SPEED_RESUME_BELOW", 8, int),
+    normal_speed=os.getenv("MISSION_SPEED") or "2",
+    min_poll=env_number("MIN_POLL_INTERVAL", 2),
+    max_poll=env_number("MAX_POLL_INTERVAL", 20),
+    max_drain=env_number("MAX_DRAIN_MINUTES", 10),
+)
+
+AAO_INDEX_SCRIPT = """
+return Array.prototype.map.call(document.querySelectorAll('.aao_searchable'), function (link) {
+    var span = link.querySelector("span[id^='available_aao_']");
+    return {
+        attribute: link.getAttribute('search_attribute'),
+        available: span ? parseInt(span.textContent, 10) : null,
+        success: span ? (' ' + span.className + ' ').indexOf(' label-success ') >= 0 : null
+    };
+});
+"""
+
+SELECT_VEHICLES_SCRIPT = """
+var plan = arguments[0];
+var links = {};
+document.querySelectorAll('.aao_searchable').forEach(function (link) {
+    var key = link.getAttribute('search_attribute');
+    if (!(key in links)) { links[key] = link; }
+});
+var result = {};
+plan.forEach(function (item) {
+    var link = links[item[0]];
+    var selected = 0;
+    var reason = 'done';
+    for (var i = 0; link && i < item[1]; i++) {
+        var span = link.querySelector("span[id^='available_aao_']");
+        if (!span) { reason = 'no_availability_info'; break; }
+        if ((' ' + span.className + ' ').indexOf(' label-success ') < 0) { reason = 'unavailable'; break; }
+        link.click();
+        selected++;
+    }
+    result[item[0]] = {selected: selected, reason: link ? reason : 'not_found'};
+});
+return result;
+"""
+
+def build_aao_index(driver):
+    # Ein Round-Trip: search_attribute -> verfügbare Anzahl / Label-Zustand
+    index = {}
+    for entry in driver.execute_script(AAO_INDEX_SCRIPT) or []:
+        index.setdefault(entry["attribute"], entry)
+    return index
+
+def resolve_aao_attribute(vehicle_type, aao_index):
+    if vehicle_type in aao_index:
+        return vehicle_type
+    closest_match = get_close_matches(vehicle_type, [a for a in aao_index if a], n=1, cutoff=0.5)
+    return closest_match[0] if closest_match else None
+
+# vehicle_type_id -> Kategorien (Namen wie in VEHICLE_MAPPINGS), für die das Fahrzeug in der AAO zählt.
+# Kategorien, die hier nicht vorkommen, gelten als unbekannt und werden nie gestrichen. HLF 20 und NAW
+# nur unter eigenem Namen, als Ersatz für LF/RW bzw. RTW+NEF plant sie plan_dispatch über SUBSTITUTIONS.
+FLEET_TYPE_CATEGORIES = {
+    "0": ["LF"], "1": ["LF"], "6": ["LF"], "7": ["LF"], "8": ["LF"], "9": ["LF"], "37": ["LF"],
+    "30": ["HLF 20"],
+    "2": ["DLK"], "3": ["ELW"], "4": ["RW"], "5": ["GW-A"], "10": ["GW-ÖL"], "11": ["GW-L2"],
+    "12": ["GW-M"], "13": ["GW-L2"], "14": ["GW-L2"], "27": ["GW-G"], "33": ["GW-H"], "34": ["ELW 2"],
+    "36": ["MTW"], "57": ["FwK"],
+    "17": ["TLF"], "18": ["TLF"], "19": ["TLF"], "20": ["TLF"], "21": ["TLF"], "22": ["TLF"],
+    "23": ["TLF"], "24": ["TLF"], "25": ["TLF"], "26": ["TLF"],
+    "28": ["RTW"], "29": ["NEF"], "31": ["RTH"], "38": ["KTW"], "55": ["KdoW LNA"], "56": ["KdoW OrgL"],
+    "58": ["KTW Typ B"], "59": ["ELW 1 (SEG)"], "60": ["GW-San"], "73": ["G-RTW"], "74": ["NAW"],
+    "32": ["FuStW"],
+}
+
+FLEET_SCRIPT = """
+var states = arguments[0];
+var free = {};
+var seen = 0;
+document.querySelectorAll('[vehicle_type_id]').forEach(function (item) {
+    var fms = item.querySelector('.building_list_fms');
+    var match = fms ? fms.className.match(/building_list_fms_(\\d+)/) : null;
+    if (!match) { return; }
+    seen++;
+    if (states.indexOf(match[1]) >= 0) {
+        var typeId = item.getAttribute('vehicle_type_id');
+        free[typeId] = (free[typeId] || 0) + 1;
+    }
+});
+return {free: free, seen: seen};
+"""
+
+class FleetIndex:
+    # Freie Fahrzeuge (Status 1/2) pro Kategorie, einmal pro Zyklus aus der Gebäudeliste der Leitstelle.
+    # Jede Alarmierung zieht lokal ab, statt pro Einsatz an den available_aao_*-Spans auszuprobieren.
+    # Die Flotte ist eine obere Grenze (die AAO des Einsatzes sieht nur Fahrzeuge in Reichweite),
+    # gestrichen wird also nur, was sicher nicht geht.
+    def __init__(self, categories, free_states=("1", "2")):
+        self.categories = categories
+        self.known = {category for names in categories.values() for category in names}
+        self.free_states = list(free_states)
+        self.free = None
+        self.blocked = {}
+        self.lock = threading.Lock()
+        self.refreshes = 0
+        self.dispatched_units = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    def load(self, free_by_type, seen):
+        free = None
+        if seen:
+            free = dict.fromkeys(self.known, 0)
+            for type_id, count in free_by_type.items():
+                for category in self.categories.get(str(type_id), ()):
+                    free[category] += count
+        with self.lock:
+            self.free = free
+            self.refreshes += 1
+        if free is not None:
+            METRICS.gauge("fleet_free_vehicles", sum(free_by_type.values()))
+        return free
+
+    def refresh(self, driver):
+        try:
+            result = driver.execute_script(FLEET_SCRIPT, self.free_states) or {}
+        except Exception as e:
+            logging.warning(f"Could not read fleet availability: {e}")
+            result = {}
+        return self.load(result.get("free") or {}, result.get("seen", 0))
+
+    def available(self, vehicle_type):
+        # None = unbekannt (noch kein refresh oder keine Kategorie aus FLEET_TYPE_CATEGORIES)
+        with self.lock:
+            if self.free is None:
+                return None
+            return self.free.get(vehicle_type)
+
+    def limit(self, available, required_vehicles, substitutions=SUBSTITUTIONS):
+        # AAO-Verfügbarkeit des Einsatzes durch die Flotte nach oben begrenzen, für plan_dispatch
+        if self.free is None:
+            return available
+        fallback = sum(required_vehicles.values()) or 1
+        limited = {}
+        for vehicle_type in set(required_vehicles) | {vehicle for vehicle, _ in substitutions}:
+            value = available.get(vehicle_type, 0) if available is not None else fallback
+            free = self.available(vehicle_type)
+            limited[vehicle_type] = value if free is None else min(value, free)
+        return limited
+
+    def drop_impossible(self, vehicles):
+        # Mehr anfordern als frei ist, geht nicht: kürzen bzw. streichen, Rest in dropped
+        kept = VehicleCounts.from_dict(vehicles)
+        dropped = {}
+        for vehicle_type, count in vehicles.items():
+            free = self.available(vehicle_type)
+            if free is not None and count > free:
+                kept = kept.replace(vehicle_type, free)
+                dropped[vehicle_type] = count - free
+        if dropped:
+            with self.lock:
+                self.dropped += sum(dropped.values())
+            logging.info(f"No free units for {dropped}, not requesting them this cycle")
+        return kept, dropped
+
+    def dispatched(self, vehicle_type, count):
+        with self.lock:
+            self.dispatched_units += count
+            if self.free is not None and vehicle_type in self.free:
+                self.free[vehicle_type] = max(0, self.free[vehicle_type] - count)
+
+    def observe(self, mission_id, signature, blocked):
+        # blocked: Kategorien, an denen der Einsatz zuletzt gescheitert ist, ohne dass sonst etwas ging
+        with self.lock:
+            if blocked:
+                self.blocked[mission_id] = (signature, set(blocked))
+            else:
+                self.blocked.pop(mission_id, None)
+
+    def can_progress(self, mission_id, signature):
+        # Geändert in der Seitenleiste oder wieder freie Fahrzeuge: neuer Versuch
+        signature_then, blocked = self.blocked.get(mission_id, (None, None))
+        if not blocked or signature != signature_then:
+            return True
+        if any(self.available(vehicle_type) != 0 for vehicle_type in blocked):
+            return True
+        with self.lock:
+            self.skipped += 1
+        return False
+
+    def forget_missing(self, mission_ids):
+        mission_ids = set(mission_ids)
+        with self.lock:
+            self.blocked = {m: b for m, b in self.blocked.items() if m in mission_ids}
+
+    def checkpoint(self):
+        # Nur die blockierten Einsätze, die freien Fahrzeuge liest der nächste Zyklus ohnehin neu
+        with self.lock:
+            return {"blocked": {m: [signature, sorted(b)] for m, (signature, b) in self.blocked.items()}}
+
+    def restore(self, state):
+        with self.lock:
+            self.blocked = {m: (signature, set(b)) for m, (signature, b) in (state.get("blocked") or {}).items()}
+
+    def stats(self):
+        with self.lock:
+            return {
+                "free": sum(self.free.values()) if self.free is not None else None,
+                "refreshes": self.refreshes,
+                "dispatched": self.dispatched_units,
+                "dropped": self.dropped,
+                "blocked": len(self.blocked),
+                "skipped": self.skipped,
+            }
+
+FLEET_INDEX = FleetIndex(env_json("FLEET_TYPE_CATEGORIES", FLEET_TYPE_CATEGORIES))
+
+def select_vehicles(driver, required_vehicles, alarm_after_selection=True):
+    # Liefert Fahrzeugtyp -> tatsächlich ausgewählt, leer (falsy) wenn nichts ausgewählt wurde
+    selected = {}
+    plan = []
+    if required_vehicles:
+        aao_index = build_aao_index(driver)
+        for vehicle_type, count in required_vehicles.items():
+            logging.info(f"Preparing to select {count} vehicle(s) of type '{vehicle_type}'")
+            attribute = resolve_aao_attribute(vehicle_type, aao_index)
+            if attribute is None:
+                logging.warning(f"Could not find vehicle: {vehicle_type}")
+                note_dispatch(vehicle_type, count, 0)
+            elif aao_index[attribute]["success"] is False:
+                logging.info(f"No vehicles available for {vehicle_type}. Skipping.")
+                note_dispatch(vehicle_type, count, 0)
+            else:
+                plan.append((vehicle_type, attribute, count))
+    if plan:
+        # Alle Klicks eines Dispatch-Plans in einem Script-Aufruf
+        with METRICS.span("selection"):
+            results = driver.execute_script(SELECT_VEHICLES_SCRIPT, [[attribute, count] for _, attribute, count in plan])
+        for vehicle_type, attribute, count in plan:
+            result = results.get(attribute, {"selected": 0, "reason": "not_found"})
+            note_dispatch(vehicle_type, count, result["selected"])
+            FLEET_INDEX.dispatched(vehicle_type, result["selected"])
+            if result["selected"]:
+                selected[vehicle_type] = selected.get(vehicle_type, 0) + result["selected"]
+                logging.info(f"Selected {result['selected']}/{count} vehicle(s): {vehicle_type}")
+            if result["reason"] == "unavailable":
+                logging.info(f"No vehicles available for {vehicle_type}. Skipping.")
+            elif result["reason"] == "no_availability_info":
+                logging.warning(f"No availability info for {vehicle_type}")
+            elif result["reason"] == "not_found":
+                logging.warning(f"Could not find vehicle: {vehicle_type}")
 
     if alarm_after_selection:
         sleep(0.125)
         alarm_button = driver.find_element(By.ID, 'mission_alarm_btn')
-        alarm_button.click()
-        logging.info("Alarm button clicked")
-        sleep(6)
-    return selected_any
-
-def handle_water_and_dispatch(driver, missing_vehicles):
-    logging.info("Dispatching all required vehicles first, then recalculate missing water.")
-    if missing_vehicles:
-        select_vehicles(driver, missing_vehicles, alarm_after_selection=False)
-    else:
-        select_vehicles(driver, {}, alarm_after_selection=False)
+        with METRICS.span("alarm"):
+            alarm_button.click()
+            logging.info("Alarm button clicked")
+            note_pass(alarmed=wait_for_alarm_response(driver, alarm_button))
+    return selected
+
+# Liter Wasser pro AAO-Kategorie, jeweils ein typischer Tank der Kategorie (LF 10, TLF 3000, ...).
+# Mit dem kleinsten Tank würde ein großer Wasserbedarf um ein Vielfaches überplant; reicht es doch
+# nicht, legt handle_water_and_dispatch nach dem Neulesen des Balkens einzeln LF nach.
+WATER_CAPACITIES = env_json("WATER_CAPACITIES", {
+    "HLF 20": 1600,
+    "GW-L2": 2000,
+    "TLF": 3000,
+    "LF": 1200,
+})
+
+def plan_water_dispatch(missing_water, aao_index, capacities=WATER_CAPACITIES):
+    # Möglichst wenige Fahrzeuge: immer das mit dem größten Tank zuerst
+    plan = {}
+    attributes = set()
+    remaining = missing_water
+    for vehicle_type, capacity in sorted(capacities.items(), key=lambda item: -item[1]):
+        if remaining <= 0:
+            break
+        # Wie select_vehicles über resolve_aao_attribute, damit abweichende AAO-Namen gefunden werden
+        attribute = resolve_aao_attribute(vehicle_type, aao_index)
+        entry = aao_index.get(attribute) if attribute else None
+        if not entry or not entry["success"] or not entry["available"] or attribute in attributes:
+            continue
+        attributes.add(attribute)
+        count = min(entry["available"], math.ceil(remaining / capacity))
+        plan[vehicle_type] = count
+        remaining -= count * capacity
+    return plan
+
+def water_still_missing(missing_water, vehicles, capacities=WATER_CAPACITIES):
+    # Schätzung ohne Neulesen des Balkens: vehicles sind die tatsächlich ausgewählten Fahrzeuge
+    return missing_water - sum(capacities.get(t, 0) * n for t, n in (vehicles or {}).items())
 
-    missing_water = extract_missing_water(driver)
-    logging.info(f"Missing water after dispatching main vehicles: {missing_water}")
+@METRICS.timed("water_and_dispatch")
+def handle_water_and_dispatch(driver, missing_vehicles, missing_water):
+    # missing_water ist der Stand vor der Auswahl (derselbe Wert wie im Fingerabdruck)
+    logging.info("Dispatching all required vehicles first, then plan the missing water.")
+    selected = select_vehicles(driver, missing_vehicles or {}, alarm_after_selection=False)
+    if missing_water > 0:
+        remaining = water_still_missing(missing_water, selected)
+        logging.info(f"Missing water after dispatching main vehicles: about {remaining}")
+        if remaining > 0:
+            water_plan, _ = FLEET_INDEX.drop_impossible(plan_water_dispatch(remaining, build_aao_index(driver)))
+            if water_plan:
+                logging.info(f"Water plan for {remaining} l: {water_plan}")
+                select_vehicles(driver, water_plan, alarm_after_selection=False)
+        wait_for_dom_quiet(driver)
+        missing_water = extract_missing_water(driver)
+        logging.info(f"Missing water after water plan: {missing_water}")
+    # Nur noch falls die Tankgrößen daneben lagen: einzeln LF nachlegen
     iteration = 0
     while missing_water > 0:
         iteration += 1
         logging.info(f"Iteration {iteration} - Missing water: {missing_water} - dispatching LF")
-        selected = select_vehicles(driver, {"LF": 1}, alarm_after_selection=False)
+        selected = FLEET_INDEX.available("LF") != 0 and select_vehicles(driver, {"LF": 1}, alarm_after_selection=False)
         if not selected:
-            logging.warning("No more LFs available. Closing this mission tab and returning.")
-            driver.close()
-            if driver.window_handles:
-                driver.switch_to.window(driver.window_handles[0])
+            logging.warning("No more LFs available. Leaving this mission and returning.")
+            tabs_for(driver).switch("main")
             return True
-        sleep(0.2)
+        wait_for_dom_quiet(driver)
         missing_water = extract_missing_water(driver)
         logging.info(f"Missing water after LF dispatch: {missing_water}")
 
@@ -568,6 +1880,266 @@ def handle_water_and_dispatch(driver, missing_vehicles):
     select_vehicles(driver, {}, alarm_after_selection=True)
     return False
 
+Hospital = namedtuple("Hospital", ["id", "name", "distance", "free_beds", "specialty", "eligible", "href"])
+
+def parse_number(text):
+    # "3,2 km" -> 3.2, "12" -> 12.0, sonst None
+    match = re.search(r'\d+(?:[.,]\d+)?', text or "")
+    return float(match.group(0).replace(',', '.')) if match else None
+
+def parse_hospital_table(tree, page_url):
+    hospitals_table = first(tree.xpath("//*[@id='own-hospitals']"))
+    if hospitals_table is None:
+        raise ValueError("no own-hospitals table")
+    rows = hospitals_table.xpath('.//tr')
+    # Spalten über die Überschriften finden, die Reihenfolge ist nicht überall gleich
+    headers = [node_text(th).lower() for th in rows[0].xpath('./th|./td')] if rows else []
+    def column(*names):
+        return next((i for i, header in enumerate(headers) if any(name in header for name in names)), None)
+    distance_col = column("entfernung")
+    beds_col = column("betten")
+    specialty_col = column("fachabteilung", "abteilung")
+    hospitals = []
+    for row in rows[1:]:
+        cells = row.xpath('./td')
+        button = first(row.xpath('.//a'))
+        if not cells or button is None:
+            continue
+        def cell(index):
+            return node_text(cells[index]) if index is not None and index < len(cells) else None
+        href = urljoin(page_url, button.get("href"))
+        match = re.search(r'/patient/(\d+)', href)
+        beds = parse_number(cell(beds_col))
+        hospitals.append(Hospital(
+            id=match.group(1) if match else None,
+            name=node_text(cells[0]),
+            distance=parse_number(cell(distance_col)),
+            free_beds=int(beds) if beds is not None else None,
+            specialty=(cell(specialty_col) or "").lower().startswith("ja"),
+            eligible="btn-success" in (button.get("class") or ""),
+            href=href,
+        ))
+    return hospitals
+
+def rank_hospitals(hospitals):
+    # Passende Fachabteilung zuerst, dann die kürzeste Entfernung, dann die meisten freien Betten
+    candidates = [h for h in hospitals if h.eligible and (h.free_beds is None or h.free_beds > 0)]
+    return sorted(candidates, key=lambda h: (
+        not h.specialty,
+        h.distance if h.distance is not None else float("inf"),
+        -(h.free_beds or 0),
+    ))
+
+def parse_hospital_choice(tree, page_url):
+    ranked = rank_hospitals(parse_hospital_table(tree, page_url))
+    return ranked[0].href if ranked else None
+
+class HospitalCache:
+    # Entfernung, Fachabteilung und die grünen Buttons der Krankenhausliste hängen am Einsatz, gemerkt
+    # wird die Liste darum pro Einsatz. Nach jeder bestätigten Zuweisung wird lokal ein Bett abgezogen,
+    # so kostet eine MANV-Welle von Sprechwünschen am selben Einsatz nur einen Seitenaufruf.
+    def __init__(self, ttl=60, max_entries=32):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.loads = 0
+        self.assignments = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def get(self, mission_id):
+        with self.lock:
+            entry = self.entries.get(mission_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return None
+            return list(entry[1])
+
+    def store(self, mission_id, hospitals):
+        with self.lock:
+            self.loads += 1
+            if mission_id is None:
+                return
+            self.entries[mission_id] = (time.time(), list(hospitals))
+            self.entries.move_to_end(mission_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def assigned(self, mission_id, hospital_id):
+        with self.lock:
+            self.assignments += 1
+            entry = self.entries.get(mission_id)
+            if entry is None:
+                return
+            self.entries[mission_id] = (entry[0], [
+                h._replace(free_beds=h.free_beds - 1) if h.id == hospital_id and h.free_beds is not None else h
+                for h in entry[1]
+            ])
+
+    def rejected_assignment(self, mission_id):
+        with self.lock:
+            self.rejected += 1
+            self.entries.pop(mission_id, None)
+
+    def invalidate(self, mission_id):
+        with self.lock:
+            self.entries.pop(mission_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {"missions": len(self.entries), "loads": self.loads, "assignments": self.assignments,
+                    "rejected": self.rejected}
+
+    def checkpoint(self):
+        with self.lock:
+            return {
+                "entries": {m: [loaded_at, [h._asdict() for h in hospitals]]
+                            for m, (loaded_at, hospitals) in self.entries.items()},
+                "loads": self.loads, "assignments": self.assignments, "rejected": self.rejected,
+            }
+
+    def restore(self, state):
+        with self.lock:
+            self.entries = OrderedDict(
+                (m, (loaded_at, [Hospital(**h) for h in hospitals]))
+                for m, (loaded_at, hospitals) in (state.get("entries") or {}).items()
+            )
+            self.loads = state.get("loads", 0)
+            self.assignments = state.get("assignments", 0)
+            self.rejected = state.get("rejected", 0)
+
+HOSPITAL_CACHE = HospitalCache(ttl=env_number("HOSPITAL_CACHE_TTL", 60))
+
+# vehicle_type_id der Fahrzeuge, deren Sprechwunsch immer ein Patiententransport ist (RTW, RTH, KTW,
+# KTW Typ B, GRTW, NAW). Nur für diese wird die gemerkte Krankenhausliste benutzt, alle anderen und
+# unbekannte Typen laden immer die Fahrzeugseite und prüfen #own-hospitals.
+PATIENT_TRANSPORT_TYPE_IDS = set((os.getenv("PATIENT_TRANSPORT_TYPE_IDS") or "28 31 38 58 73 74").split())
+
+def load_hospital_page(driver, vehicle_url):
+    # Browser nur, wenn HTTP nicht geht; ohne #own-hospitals ist es eben kein Patiententransport
+    tree = READ_CLIENT.tree(vehicle_url)
+    if tree is None:
+        with tabs_for(driver).visit("aux", vehicle_url):
+            wait_for_ready_state(driver)
+            tree = page_tree(driver)
+    note_page("hospital", vehicle_url, tree)
+    return tree
+
+def parse_vehicle_mission(tree):
+    # Die Fahrzeugseite verlinkt den Einsatz, zu dem der Patient gehört
+    link = first(tree.xpath("//a[contains(@href, '/missions/')]"))
+    match = re.search(r'/missions/(\d+)', link.get("href")) if link is not None else None
+    return match.group(1) if match else None
+
+def parse_assignment_rejected(tree):
+    # Abgelehnt: Fehlermeldung oder weiterhin die Krankenhausliste statt der Fahrzeugseite
+    return bool(tree.xpath(f"//*[{by_class('alert-danger')}]") or tree.xpath("//*[@id='own-hospitals']"))
+
+def transport_patient(driver, vehicle_url, type_id=None, mission_id=None):
+    match = re.search(r'/vehicles/(\d+)', vehicle_url)
+    if not match:
+        return False
+    vehicle_id = match.group(1)
+    hospitals = None
+    if mission_id is not None and type_id is not None and str(type_id) in PATIENT_TRANSPORT_TYPE_IDS:
+        # Nur bei sicher bekanntem Patiententyp ohne #own-hospitals-Prüfung zuweisen
+        hospitals = HOSPITAL_CACHE.get(mission_id)
+    cached = hospitals is not None
+    if hospitals is None:
+        tree = load_hospital_page(driver, vehicle_url)
+        if not tree.xpath("//*[@id='own-hospitals']"):
+            # z.B. Gefangenentransport, darum kümmert sich select_prisoner_vehicle
+            return False
+        hospitals = parse_hospital_table(tree, vehicle_url)
+        mission_id = mission_id or parse_vehicle_mission(tree)
+        HOSPITAL_CACHE.store(mission_id, hospitals)
+    ranked = rank_hospitals(hospitals)
+    if not ranked or ranked[0].id is None:
+        HOSPITAL_CACHE.invalidate(mission_id)
+        if cached:
+            # Gemerkte Liste ist aufgebraucht, vielleicht sind inzwischen Betten frei
+            return transport_patient(driver, vehicle_url, type_id)
+        logging.info("Kein verfügbares Krankenhaus mit freien Betten gefunden.")
+        return False
+    best = ranked[0]
+    with tabs_for(driver).visit("aux", f"{BASE_URL}/vehicles/{vehicle_id}/patient/{best.id}"):
+        wait_for_ready_state(driver)
+        rejected = parse_assignment_rejected(page_tree(driver))
+    if rejected:
+        HOSPITAL_CACHE.rejected_assignment(mission_id)
+        logging.warning(f"Assignment of vehicle {vehicle_id} to {best.name} was rejected")
+        if cached:
+            # Gemerkte Liste war veraltet: einmal mit frisch geladener Liste
+            return transport_patient(driver, vehicle_url, type_id)
+        return False
+    HOSPITAL_CACHE.assigned(mission_id, best.id)
+    logging.info(f"Vehicle {vehicle_id} transports to {best.name} ({best.distance} km, {best.free_beds} beds)")
+    return True
+
+TRANSPORT_REQUESTS_SCRIPT = """
+var requests = {};
+function add(link, typeId, missionLink) {
+    var match = link ? (link.getAttribute('href') || '').match(/\\/vehicles\\/(\\d+)/) : null;
+    if (!match) { return; }
+    var entry = requests[match[1]] || (requests[match[1]] = {
+        id: match[1], type_id: null, mission_id: null, caption: link.innerText
+    });
+    if (typeId) { entry.type_id = typeId; }
+    var mission = missionLink ? (missionLink.getAttribute('href') || '').match(/\\/missions\\/(\\d+)/) : null;
+    if (mission) { entry.mission_id = mission[1]; }
+}
+document.querySelectorAll('.building_list_fms_5').forEach(function (fms) {
+    var item = fms.closest('[vehicle_type_id]') || fms.closest('li');
+    if (item) { add(item.querySelector("a[href*='/vehicles/']"), item.getAttribute('vehicle_type_id'), null); }
+});
+document.querySelectorAll('#radio_messages_important li, #radio_messages li').forEach(function (item) {
+    if (item.innerText.indexOf('Sprechwunsch') >= 0) {
+        add(item.querySelector("a[href*='/vehicles/']"), null, item.querySelector("a[href*='/missions/']"));
+    }
+});
+return Object.keys(requests).map(function (key) { return requests[key]; });
+"""
+
+@METRICS.timed("transport_sweep")
+def sweep_transport_requests(driver):
+    # Alle Sprechwünsche (Status 5) auf einmal von der Leitstelle aus, nicht erst wenn der Einsatz dran ist
+    try:
+        requests = driver.execute_script(TRANSPORT_REQUESTS_SCRIPT) or []
+    except Exception as e:
+        logging.warning(f"Could not read transport requests: {e}")
+        return 0
+    # Bekannte Fahrzeugtypen ohne Patienten (Gefangene etc.) gar nicht erst laden, die macht
+    # select_prisoner_vehicle, wenn der Einsatz dran ist
+    requests = [
+        r for r in requests
+        if r.get("type_id") is None or str(r["type_id"]) in PATIENT_TRANSPORT_TYPE_IDS
+    ]
+    # Nach Einsatz gruppiert, damit ein Einsatz seine Krankenhausliste nur einmal lädt
+    requests.sort(key=lambda r: (r.get("mission_id") is None, str(r.get("mission_id"))))
+    transported = 0
+    for request in requests:
+        try:
+            if transport_patient(
+                driver, f"{BASE_URL}/vehicles/{request['id']}", request.get("type_id"), request.get("mission_id")
+            ):
+                transported += 1
+        except Exception as e:
+            logging.error(f"Error handling transport request of vehicle {request['id']}: {e}")
+    if requests:
+        logging.info(f"Transport sweep: {transported}/{len(requests)} request(s) assigned")
+    return transported
+
+def sprechwunsch_type_id(driver, sw_div, vehicle_url):
+    # vehicle_type_id steht am Link in der Meldung oder an der Zeile des Fahrzeugs im Einsatz
+    for element in sw_div.find_elements(By.CSS_SELECTOR, "[vehicle_type_id]"):
+        return element.get_attribute("vehicle_type_id")
+    match = re.search(r'/vehicles/(\d+)', vehicle_url or "")
+    if match:
+        row = f"#vehicle_row_{match.group(1)}"
+        for element in driver.find_elements(By.CSS_SELECTOR, f"{row}[vehicle_type_id], {row} [vehicle_type_id]"):
+            return element.get_attribute("vehicle_type_id")
+    return None
+
+@METRICS.timed("sprechwunsch")
 def check_for_sprechwunsch(driver, wait):
     try:
         sprechwunsch_divs = driver.find_elements(By.CSS_SELECTOR, ".alert.alert-danger")
@@ -575,58 +2147,26 @@ def check_for_sprechwunsch(driver, wait):
             txt = sw_div.text.lower()
             if "sprechwunsch" in txt:
                 link = sw_div.find_element(By.TAG_NAME, 'a').get_attribute("href")
-                driver.execute_script(f"window.open('{link}','_blank')")
-                driver.switch_to.window(driver.window_handles[-1])
-                sleep(0.125)
+                mission_match = re.search(r'/missions/(\d+)', driver.current_url or "")
                 try:
-                    wait.until(EC.presence_of_element_located((By.ID, 'own-hospitals')))
-                    hospitals_table = driver.find_element(By.ID, 'own-hospitals')
-                    rows = hospitals_table.find_elements(By.TAG_NAME, 'tr')
-                    chosen_link = None
-                    for row in rows[1:]:
-                        try:
-                            button = row.find_element(By.XPATH, ".//a")
-                            class_attr = button.get_attribute("class")
-                            if "btn-success" in class_attr:
-                                chosen_link = button.get_attribute("href")
-                                break
-                        except Exception:
-                            continue
-                    if chosen_link:
-                        driver.execute_script(f"window.open('{chosen_link}','_blank')")
-                        driver.switch_to.window(driver.window_handles[-1])
-                        sleep(0.125)
-                        driver.close()
-                        driver.switch_to.window(driver.window_handles[-1])
-                    else:
-                        logging.info("Kein verfügbares Krankenhaus mit freien Betten gefunden.")
+                    transport_patient(
+                        driver, link, sprechwunsch_type_id(driver, sw_div, link),
+                        mission_match.group(1) if mission_match else None,
+                    )
                 except Exception as e:
                     logging.error(f"Error handling sprechwunsch/hospitals: {str(e)}")
-                driver.close()
-                driver.switch_to.window(driver.window_handles[-1])
                 sleep(0.125)
                 break
     except Exception as e:
         logging.error(f"Error checking sprechwunsch: {str(e)}")
 
-def check_mission_completed(driver):
-    try:
-        success_div = driver.find_element(By.CLASS_NAME, 'mission-success')
-        success_image = driver.find_element(By.CLASS_NAME, 'mission-success-image')
-        checkmark = success_image.find_element(By.XPATH, ".//img[@alt='Checkmark_mission_complete']")
-        if success_div and success_image and checkmark:
-            logging.info("Mission already completed, skipping...")
-            return True
-    except:
-        pass
-    try:
-        success_element = driver.find_element(By.CLASS_NAME, 'alert-success')
-        if "Einsatz abgeschlossen" in success_element.text:
-            logging.info("Mission already completed (alert), skipping...")
-            return True
-    except:
-        pass
-    return False
+def parse_mission_completed(tree):
+    success_image = first(tree.xpath(f"//*[{by_class('mission-success-image')}]"))
+    if (tree.xpath(f"//*[{by_class('mission-success')}]") and success_image is not None
+            and success_image.xpath(".//img[@alt='Checkmark_mission_complete']")):
+        return True
+    success_element = first(tree.xpath(f"//*[{by_class('alert-success')}]"))
+    return success_element is not None and "Einsatz abgeschlossen" in node_text(success_element)
 
 def check_and_click_easter_egg(driver):
     try:
@@ -637,21 +2177,23 @@ def check_and_click_easter_egg(driver):
     except Exception as e:
         logging.info(f"No Easter egg found or unable to click")
 
-def select_missing_personnel(driver, required_vehicles, enroute_personnel):
+def select_missing_personnel(tree, required_vehicles, enroute_personnel):
     try:
-        missing_personnel = extract_missing_personnel(driver)
-        if missing_personnel is None:
-            missing_personnel = 0
-        missing_personnel = max(0, missing_personnel - enroute_personnel)
+        missing_personnel = parse_missing_personnel(tree)
     except Exception as e:
         logging.error(f"Error extracting missing personnel: {str(e)}")
         missing_personnel = 0
+    return add_personnel_vehicles(required_vehicles, missing_personnel, enroute_personnel)
+
+def add_personnel_vehicles(required_vehicles, missing_personnel, enroute_personnel):
+    missing_personnel = max(0, (missing_personnel or 0) - enroute_personnel)
     if missing_personnel > 0:
         lf_needed = (missing_personnel + 2) // 3
-        required_vehicles["LF"] = required_vehicles.get("LF", 0) + lf_needed
+        required_vehicles = VehicleCounts.from_dict(required_vehicles).added("LF", lf_needed)
         logging.info(f"Missing personnel: {missing_personnel}, dispatching {lf_needed} LF")
     return required_vehicles
 
+@METRICS.timed("prisoner")
 def select_prisoner_vehicle(driver):
     def open_link_in_new_tab(link):
         href = link.get_attribute("href")
@@ -659,25 +2201,14 @@ def select_prisoner_vehicle(driver):
             logging.warning("No href found on prisoner link.")
             return False
         try:
-            # Open the link in a new tab.
-            driver.execute_script("window.open(arguments[0], '_blank');", href)
-            driver.switch_to.window(driver.window_handles[-1])
-            # Wait until the new tab is fully loaded.
-            WebDriverWait(driver, 10).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
-            sleep(0.125)
-            driver.close()
-            driver.switch_to.window(driver.window_handles[0])
-            logging.info(f"Prisoner link opened and closed: {href}")
+            with tabs_for(driver).visit("aux", href):
+                wait_for_ready_state(driver)
+                if RECORDER.enabled:
+                    note_page("prisoner", href, driver.page_source)
+            logging.info(f"Prisoner link opened: {href}")
             return True
         except Exception as e:
             logging.error(f"Error handling prisoner link tab: {e}")
-            try:
-                driver.close()
-            except:
-                pass
-            driver.switch_to.window(driver.window_handles[0])
             return False
 
     try:
@@ -734,206 +2265,803 @@ def select_prisoner_vehicle(driver):
 
 def claim_rewards(driver):
     try:
-        driver.execute_script("window.open('https://www.leitstellenspiel.de/tasks/index','_blank');")
-        driver.switch_to.window(driver.window_handles[-1])
-        WebDriverWait(driver, 10).until(
-            lambda d: d.execute_script("return document.readyState") == "complete"
-        )
-        sleep(0.5)
-        # Sucht das Formular, das den "Alle abholen"-Button beinhaltet.
-        reward_forms = driver.find_elements(By.XPATH, "//form[contains(@class,'button_to') and contains(@action, '/tasks/claim_all_rewards')]")
-        if reward_forms:
-            form = reward_forms[0]
-            if form.is_displayed():
-                # Anstelle eines Klicks wird das Formular per JavaScript abgeschickt.
-                driver.execute_script("arguments[0].submit();", form)
-                logging.info("Reward form submitted: Alle abholen")
-                sleep(1.2)
+        with tabs_for(driver).visit("aux", f"{BASE_URL}/tasks/index"):
+            wait_for_ready_state(driver)
+            sleep(0.5)
+            # Sucht das Formular, das den "Alle abholen"-Button beinhaltet.
+            reward_forms = driver.find_elements(By.XPATH, "//form[contains(@class,'button_to') and contains(@action, '/tasks/claim_all_rewards')]")
+            if reward_forms:
+                form = reward_forms[0]
+                if form.is_displayed():
+                    # Anstelle eines Klicks wird das Formular per JavaScript abgeschickt.
+                    driver.execute_script("arguments[0].submit();", form)
+                    logging.info("Reward form submitted: Alle abholen")
+                    sleep(1.2)
+                else:
+                    logging.info("Reward form found but not interactable.")
             else:
-                logging.info("Reward form found but not interactable.")
-        else:
-            logging.info("No rewards available to claim.")
-        driver.close()
-        driver.switch_to.window(driver.window_handles[0])
+                logging.info("No rewards available to claim.")
     except Exception as e:
         logging.error(f"Error claiming rewards (alternative approach): {e}")
+
+SIDEBAR_SCRIPT = """
+return Array.prototype.map.call(document.querySelectorAll('.missionSideBarEntry'), function (entry) {
+    var caption = entry.querySelector('.map_position_mover');
+    var alarm = entry.querySelector('.mission-alarm-button');
+    var panel = entry.querySelector('.panel');
+    return {
+        id: entry.getAttribute('mission_id') || entry.id.replace('mission_', ''),
+        mission_type: entry.getAttribute('mission_type_id'),
+        state: entry.getAttribute('data-mission-state-filter'),
+        caption: caption ? caption.innerText : '',
+        url: alarm ? alarm.href : null,
+        signature: [entry.getAttribute('data-mission-state-filter'), entry.className, panel ? panel.className : ''].join('|')
+    };
+});
+"""
+
+def snapshot_sidebar(driver):
+    missions = driver.execute_script(SIDEBAR_SCRIPT) or []
+    for mission in missions:
+        if not mission.get("id") and mission.get("url"):
+            match = re.search(r'/missions/(\d+)', mission["url"])
+            mission["id"] = match.group(1) if match else mission["url"]
+    return missions
+
+def mission_fingerprint(current_vehicles, enroute_personnel, required_vehicles, missing_vehicles, missing_water):
+    return json.dumps(
+        [sorted(current_vehicles.items()), enroute_personnel, sorted(required_vehicles.items()),
+         sorted(missing_vehicles.items()), missing_water],
+        ensure_ascii=False,
+    )
+
+class MissionTracker:
+    # Merkt sich pro Einsatz, was beim letzten Durchlauf gesehen wurde. Solange sich der Eintrag in der
+    # Seitenleiste nicht ändert, wird der Einsatz erst nach Ablauf des Backoffs wieder geöffnet. Bleibt
+    # der Fingerabdruck mehrmals gleich, verdoppelt sich der Backoff bis max_backoff.
+    def __init__(self, base_backoff=40, max_backoff=300):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.states = {}
+        self.skipped = 0
+        self.processed = 0
+
+    def should_process(self, mission_id, sidebar_signature, now=None):
+        now = time.time() if now is None else now
+        state = self.states.get(mission_id)
+        if state is None or state["sidebar"] != sidebar_signature or now >= state["next_visit"]:
+            return True
+        self.skipped += 1
+        return False
+
+    def record(self, mission_id, sidebar_signature, fingerprint, now=None):
+        now = time.time() if now is None else now
+        state = self.states.get(mission_id)
+        unchanged = 0
+        if state is not None and fingerprint is not None and state["fingerprint"] == fingerprint:
+            unchanged = state["unchanged"] + 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** unchanged)
+        self.states[mission_id] = {
+            "sidebar": sidebar_signature,
+            "fingerprint": fingerprint,
+            "unchanged": unchanged,
+            "next_visit": now + backoff,
+        }
+        self.processed += 1
+
+    def forget_missing(self, active_ids):
+        for mission_id in set(self.states) - set(active_ids):
+            del self.states[mission_id]
+
+    def stats(self):
+        return {"tracked": len(self.states), "processed": self.processed, "skipped": self.skipped}
+
+    def checkpoint(self):
+        return {"states": dict(self.states), "processed": self.processed, "skipped": self.skipped}
+
+    def restore(self, state):
+        self.states = dict(state.get("states") or {})
+        self.processed = state.get("processed", 0)
+        self.skipped = state.get("skipped", 0)
+
+MISSION_TRACKER = MissionTracker(
+    base_backoff=env_number("MISSION_BACKOFF", 40),
+    max_backoff=env_number("MISSION_MAX_BACKOFF", 300),
+)
+
+MissionOutcome = namedtuple("MissionOutcome", ["fingerprint", "patients", "blocked"])
+
+# Gewichte pro Einflussgröße, überschreibbar per SCHEDULER_WEIGHTS='{"credits": 5}'
+SCHEDULER_WEIGHTS = {
+    "age": 1.0,           # pro Minute seit der Einsatz zum ersten Mal in der Seitenleiste stand
+    "credits": 2.0,       # pro 1000 Credits im Durchschnitt (aus dem Anforderungs-Cache)
+    "undispatched": 5.0,  # noch kein Fahrzeug unterwegs (roter Eintrag)
+    "patients": 1.0,      # pro Patient beim letzten Durchlauf bzw. Mindestanzahl laut Hilfeseite
+    "failed": 3.0,        # im letzten Zyklus mit Fehler abgebrochen
+}
+
+class MissionScheduler:
+    # Reihenfolge der fälligen Einsätze nach Priorität statt nach Seitenleiste (Heap, höchste zuerst).
+    # Mit time_budget > 0 endet ein Zyklus nach so vielen Sekunden, der Rest kommt im nächsten Zyklus
+    # dran und ist dann älter, rutscht also nach vorne.
+    def __init__(self, weights=None, time_budget=0):
+        self.weights = dict(SCHEDULER_WEIGHTS, **(weights or {}))
+        self.time_budget = time_budget
+        self.first_seen = {}
+        self.patients = {}
+        self.failed = set()
+        self.deferred = 0
+
+    def observe_sidebar(self, mission_entries, now=None):
+        now = time.time() if now is None else now
+        active_ids = set()
+        for mission in mission_entries:
+            active_ids.add(mission["id"])
+            self.first_seen.setdefault(mission["id"], now)
+        for mission_id in set(self.first_seen) - active_ids:
+            del self.first_seen[mission_id]
+            self.patients.pop(mission_id, None)
+        self.failed &= active_ids
+
+    def priority(self, mission, now=None):
+        now = time.time() if now is None else now
+        mission_id = mission["id"]
+        entry = REQUIREMENTS_CACHE.peek(mission.get("mission_type") or "")
+        patients = self.patients.get(mission_id, entry["min_patients"] if entry else 0)
+        factors = {
+            "age": (now - self.first_seen.get(mission_id, now)) / 60,
+            "credits": (entry.get("credits", 0) if entry else 0) / 1000,
+            "undispatched": 1 if mission.get("state") == "red" else 0,
+            "patients": patients,
+            "failed": 1 if mission_id in self.failed else 0,
+        }
+        return sum(self.weights.get(name, 0) * value for name, value in factors.items())
+
+    def order(self, missions, now=None):
+        now = time.time() if now is None else now
+        heap = [(-self.priority(mission, now), i, mission) for i, mission in enumerate(missions)]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def deadline(self):
+        return time.monotonic() + self.time_budget if self.time_budget > 0 else None
+
+    def observe(self, mission, status, outcome):
+        mission_id = mission["id"]
+        if status == "deferred":
+            self.deferred += 1
+            return
+        if status == "failed":
+            self.failed.add(mission_id)
+            return
+        self.failed.discard(mission_id)
+        if outcome is not None:
+            self.patients[mission_id] = outcome.patients
+
+    def stats(self):
+        return {"tracked": len(self.first_seen), "failed": len(self.failed), "deferred": self.deferred}
+
+    def checkpoint(self):
+        return {"first_seen": dict(self.first_seen), "patients": dict(self.patients),
+                "failed": sorted(self.failed), "deferred": self.deferred}
+
+    def restore(self, state):
+        self.first_seen = dict(state.get("first_seen") or {})
+        self.patients = dict(state.get("patients") or {})
+        self.failed = set(state.get("failed") or [])
+        self.deferred = state.get("deferred", 0)
+
+MISSION_SCHEDULER = MissionScheduler(
+    weights=env_json("SCHEDULER_WEIGHTS", {}),
+    time_budget=env_number("CYCLE_TIME_BUDGET", 120),
+)
+
+def process_mission(driver, wait, mission_url):
+    # Einsatzseite einmal pro Durchlauf übertragen und parsen, die parse_*-Funktionen teilen sich den Baum:
+    # per HTTP, solange die Sitzung passt, sonst page_source aus dem Browser. Nach der Auswahl ändert sich
+    # nur der Wasserbalken, den liest extract_missing_water gezielt nach.
+    tree = READ_CLIENT.tree(mission_url)
+    if tree is not None and parse_mission_completed(tree):
+        logging.info("Mission already completed (HTTP check), skipping without opening a tab...")
+        note_pass(completed=True)
+        return None
+    tabs = tabs_for(driver)
+    with METRICS.span("tab_open"):
+        tabs.open("mission", mission_url)
+        wait_for_ready_state(driver)
+    if tree is None:
+        tree = page_tree(driver)
+        if parse_mission_completed(tree):
+            logging.info("Mission already completed, skipping...")
+            note_pass(completed=True)
+            tabs.switch("main")
+            return
+
+    check_and_click_easter_egg(driver)
+    check_for_sprechwunsch(driver, wait)
+    select_prisoner_vehicle(driver)
+    mission_title = wait.until(EC.presence_of_element_located((By.ID, 'missionH1')))
+    if "Verband" in mission_title.text:
+        logging.info("Verband mission detected in title, closing...")
+        tabs.switch("main")
+        return
+    if RECORDER.enabled:
+        note_page("mission", mission_url, tree)
+    with METRICS.span("vehicle_scrape"):
+        current_vehicles, enroute_personnel = extract_current_vehicles(driver)
+    help_button = driver.find_element(By.ID, 'mission_help')
+    help_url = help_button.get_attribute('href')
+    sleep(0.03125)
+    with METRICS.span("help_page"):
+        requirements = get_mission_requirements(driver, wait, help_url)
+    fingerprint = None
+    patients = 0
+    blocked = None
+    if requirements is not None:
+        snapshot = MissionSnapshot(current_vehicles, enroute_personnel, *requirements)
+        logging.info(f"Required vehicles: {snapshot.required}")
+        logging.info(f"Current vehicles: {snapshot.present}")
+        with METRICS.span("planning"):
+            required_vehicles, patients = handle_patients_and_nef(
+                driver, snapshot.required, snapshot.present, snapshot.enroute_personnel,
+                snapshot.min_patients, snapshot.nef_probability,
+            )
+            available = aao_availability(required_vehicles, build_aao_index(driver))
+            available = FLEET_INDEX.limit(available, required_vehicles)
+            missing_vehicles = calculate_missing_vehicles(required_vehicles, snapshot.present, available)
+            missing_vehicles = select_missing_personnel(tree, missing_vehicles, snapshot.enroute_personnel)
+            missing_vehicles, dropped = FLEET_INDEX.drop_impossible(missing_vehicles)
+            # Nichts alarmierbar und nur an fehlenden Fahrzeugen gescheitert: erst wieder, wenn welche frei sind
+            blocked = list(dropped) if dropped and not missing_vehicles else None
+        note_pass(required=dict(required_vehicles), present=dict(snapshot.present), planned=dict(missing_vehicles))
+        missing_water = parse_missing_water(tree)
+        fingerprint = mission_fingerprint(
+            snapshot.present, snapshot.enroute_personnel, required_vehicles, missing_vehicles, missing_water,
+        )
+        # Immer handle_water_and_dispatch aufrufen
+        closed_tab = handle_water_and_dispatch(driver, missing_vehicles, missing_water)
+        if closed_tab:
+            logging.info("Tab closed due to insufficient LFs. Skipping further steps.")
+            return MissionOutcome(fingerprint, patients, blocked)
+
+        if missing_vehicles:
+            logging.info("Vehicles dispatched")
+        else:
+            logging.info("No additional vehicles needed")
+    with METRICS.span("tab_close"):
+        tabs.switch("main")
+    sleep(0.125)
+    return MissionOutcome(fingerprint, patients, blocked)
+
+BROWSER_PROFILES = {
+    "default": {"headless": False, "page_load_strategy": "normal", "block_resources": False},
+    # Kein Fenster, nicht auf Bilder/Fonts/Kartenkacheln warten
+    "lean": {"headless": True, "page_load_strategy": "eager", "block_resources": True},
+}
+
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*tile.openstreetmap.*", "*/tiles/*", "*.mapbox.com/*", "*basemaps.cartocdn.com/*",
+    "*google-analytics.com/*", "*googletagmanager.com/*", "*doubleclick.net/*", "*facebook.net/*",
+]
+
+def browser_settings(profile=None):
+    profile = profile or os.getenv("BROWSER_PROFILE", "default")
+    if profile not in BROWSER_PROFILES:
+        logging.warning(f"Unknown browser profile '{profile}', using default")
+        profile = "default"
+    settings = dict(BROWSER_PROFILES[profile], profile=profile)
+    settings["headless"] = env_flag("HEADLESS", settings["headless"])
+    settings["block_resources"] = env_flag("BLOCK_RESOURCES", settings["block_resources"])
+    settings["page_load_strategy"] = os.getenv("PAGE_LOAD_STRATEGY") or settings["page_load_strategy"]
+    driver_path = os.getenv("CHROMEDRIVER_PATH")
+    if not driver_path:
+        driver_path = './chromedriver.exe' if os.path.exists('./chromedriver.exe') else shutil.which('chromedriver')
+    settings["driver_path"] = driver_path
+    settings["binary"] = os.getenv("CHROME_BINARY")
+    settings["extra_args"] = os.getenv("CHROME_ARGS", "").split()
+    settings["user_data_dir"] = os.getenv("CHROME_USER_DATA_DIR")
+    return settings
+
+def chrome_options(settings):
+    options = webdriver.ChromeOptions()
+    options.page_load_strategy = settings["page_load_strategy"]
+    if settings["binary"]:
+        options.binary_location = settings["binary"]
+    if settings["headless"]:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,900")
+    if settings["block_resources"]:
+        # Bilder in allen Tabs abschalten, der Rest läuft über Network.setBlockedURLs
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--mute-audio")
+    if settings.get("user_data_dir"):
+        # Persistentes Profil: Cookies/Cache überleben einen Neustart des Browsers
+        options.add_argument(f"--user-data-dir={os.path.abspath(settings['user_data_dir'])}")
+    for argument in settings["extra_args"]:
+        options.add_argument(argument)
+    return options
+
+def block_heavy_resources(driver):
+    # Gilt für das aktuelle Tab
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        logging.warning(f"Could not block heavy resources: {e}")
+
+def run_mission(driver, wait, mission, deadline=None):
+    # Liefert (status, outcome) mit status "done", "failed" oder "deferred" (Zeitbudget aufgebraucht)
+    if deadline is not None and time.monotonic() >= deadline:
+        return "deferred", None
+    record = {
+        "mission_id": mission["id"], "mission_type": mission.get("mission_type"), "caption": mission.get("caption"),
+        "started_at": time.time(), "status": "failed", "dispatches": [],
+    }
+    PASS_CONTEXT.record = record
+    CHECKPOINT.started(mission["id"])
+    CHECKPOINT.maybe_save()
+    start = time.monotonic()
+    try:
+        with METRICS.collect() as phases, METRICS.span("mission"):
+            record["phases"] = phases
+            outcome = process_mission(driver, wait, mission["url"])
+        record["status"] = "done"
+        return "done", outcome
+    except Exception as e:
+        if ("unexpected alert open" in str(e).lower()
+            or "no such element" in str(e).lower()
+            or "element not found" in str(e).lower()):
+            try:
+                Alert(driver).accept()
+                Alert(driver).send_keys("Enter")
+                sleep(0.05)
+            except:
+                pass
+        else:
+            logging.error(f"Error processing mission: {str(e)}")
         try:
-            driver.close()
-        except Exception:
+            # Der Einsatz-Tab bleibt offen und wird beim nächsten Einsatz weiterverwendet
+            tabs_for(driver).switch("main")
+        except:
             pass
-        driver.switch_to.window(driver.window_handles[0])
+        return "failed", None
+    finally:
+        PASS_CONTEXT.record = None
+        CHECKPOINT.finished(mission["id"])
+        record["duration"] = round(time.monotonic() - start, 4)
+        RECORDER.save(record)
+        record.pop("pages", None)
+        MISSION_HISTORY.record_pass(record)
+
+class MissionWorkerPool:
+    # Mehrere Browser mit derselben Sitzung (Cookies aus SESSION_COOKIES_FILE). Jeder Worker-Thread
+    # leiht sich exklusiv einen Browser, die Tab-Rollen (tabs_for) gehören damit genau einem Thread.
+    # Stirbt ein Browser, wird er beim nächsten Einsatz ersetzt, die anderen laufen weiter.
+    def __init__(self, size, settings=None):
+        # Kein CHROME_USER_DATA_DIR: Chrome startet nicht zweimal auf demselben Profil, die Sitzung
+        # kommt ohnehin aus den Cookies
+        self.settings = dict(settings or browser_settings(), user_data_dir=None)
+        self.drivers = queue.Queue()
+        started = [driver for driver in (self.start_driver() for _ in range(size)) if driver is not None]
+        for driver in started:
+            self.drivers.put(driver)
+        # size 0: run_cycle arbeitet die Einsätze nacheinander im Hauptbrowser ab
+        self.size = len(started)
+        if self.size < size:
+            logging.warning(f"Only {self.size} of {size} worker browser(s) started")
+        self.executor = ThreadPoolExecutor(max_workers=max(1, self.size), thread_name_prefix="mission-worker")
+
+    def start_driver(self):
+        try:
+            driver = create_driver(self.settings)
+        except Exception as e:
+            logging.error(f"Could not start worker browser: {e}")
+            return None
+        if restore_session(driver):
+            return driver
+        logging.error("Worker browser could not reuse the session")
+        try:
+            driver.quit()
+        except:
+            pass
+        return None
+
+    def run_one(self, mission, deadline=None):
+        if deadline is not None and time.monotonic() >= deadline:
+            return "deferred", None
+        driver = self.drivers.get()
+        try:
+            if driver is None or not driver_alive(driver):
+                if driver is not None:
+                    try:
+                        driver.quit()
+                    except:
+                        pass
+                driver = self.start_driver()
+                if driver is None:
+                    return "failed", None
+            tabs_for(driver).check()
+            return run_mission(driver, WebDriverWait(driver, 10), mission, deadline)
+        except Exception as e:
+            logging.error(f"Worker error on mission {mission.get('id')}: {e}")
+            return "failed", None
+        finally:
+            self.drivers.put(driver)
+
+    def map(self, missions, deadline=None):
+        missions = list(missions)
+        return zip(missions, self.executor.map(functools.partial(self.run_one, deadline=deadline), missions))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        while not self.drivers.empty():
+            driver = self.drivers.get()
+            if driver is not None:
+                try:
+                    driver.quit()
+                except:
+                    pass
+
+def create_driver(settings=None):
+    settings = settings or browser_settings()
+    logging.info(
+        f"Starting Chrome with profile '{settings['profile']}' (headless={settings['headless']}, "
+        f"pageLoadStrategy={settings['page_load_strategy']}, block_resources={settings['block_resources']})"
+    )
+    service = Service(settings["driver_path"]) if settings["driver_path"] else Service()
+    driver = webdriver.Chrome(service=service, options=chrome_options(settings))
+    driver.block_resources = settings["block_resources"]
+    if settings["block_resources"]:
+        block_heavy_resources(driver)
+    return driver
+
+def login(driver, email, password):
+    sleep(0.25)
+    driver.get(f'{BASE_URL}/users/sign_in')
+    sleep(0.25)
+    email_login = driver.find_element(By.ID, 'user_email')
+    email_login.send_keys(email)
+    sleep(0.125)
+    password_login = driver.find_element(By.ID, 'user_password')
+    password_login.send_keys(password)
+    sleep(0.125)
+    user_remember_me = driver.find_element(By.ID, 'user_remember_me')
+    user_remember_me.click()
+    sleep(0.125)
+    login = driver.find_element(By.NAME, 'commit')
+    login.click()
+    sleep(0.25)
+
+SESSION_COOKIES_FILE = os.getenv("SESSION_COOKIES_FILE", "session_cookies.json")
+COOKIE_KEYS = ("name", "value", "path", "domain", "secure", "httpOnly", "expiry", "sameSite")
+
+def save_session(driver, path=SESSION_COOKIES_FILE):
+    try:
+        cookies = [{k: v for k, v in cookie.items() if k in COOKIE_KEYS} for cookie in driver.get_cookies()]
+        tmp_path = path + ".tmp"
+        # Live-Sitzung: nur für den eigenen Benutzer lesbar. Eine alte .tmp behielte ihre Rechte, also weg damit
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            json.dump(cookies, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Could not save session cookies: {e}")
+
+def is_logged_in(driver, timeout=10):
+    # Eingeloggt landet man auf der Leitstelle, sonst auf dem Login-Formular
+    wait_for(
+        driver, "session_check",
+        lambda d: d.find_elements(By.ID, 'mission_list') or d.find_elements(By.ID, 'user_email'),
+        timeout,
+    )
+    return bool(driver.find_elements(By.ID, 'mission_list'))
+
+def restore_session(driver, path=SESSION_COOKIES_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cookies = json.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logging.warning(f"Could not load session cookies: {e}")
+        return False
+    # Cookies lassen sich nur für die aktuell geladene Domain setzen
+    driver.get(f'{BASE_URL}/robots.txt')
+    for cookie in cookies:
+        if cookie.get("expiry") and cookie["expiry"] < time.time():
+            continue
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            logging.warning(f"Could not restore cookie {cookie.get('name')}: {e}")
+    driver.get(f'{BASE_URL}/')
+    return is_logged_in(driver)
+
+def is_logged_in_already(driver):
+    # Nach einem Fehler im alten Browser (oder mit persistentem Profil): reicht ein Blick auf die Leitstelle?
+    try:
+        if not driver.current_url.startswith(BASE_URL) and not os.getenv("CHROME_USER_DATA_DIR"):
+            return False
+        driver.get(f'{BASE_URL}/')
+        return is_logged_in(driver)
+    except Exception:
+        return False
+
+def ensure_logged_in(driver, email, password):
+    if is_logged_in_already(driver) or restore_session(driver):
+        logging.info("Reusing existing session, skipping login")
+        return
+    logging.info("No valid session, logging in")
+    login(driver, email, password)
+    save_session(driver)
+
+def driver_alive(driver):
+    try:
+        driver.window_handles
+        return True
+    except Exception:
+        return False
+
+CHECKPOINT_VERSION = 1
+
+class Checkpoint:
+    # Laufzeitzustand (Backoff pro Einsatz, Priorisierung, Regler, Krankenhausliste, Zähler) wird alle
+    # interval Sekunden in eine kleine JSON-Datei geschrieben: tmp-Datei, fsync, os.replace, ein Absturz
+    # mitten im Schreiben lässt also die alte Datei stehen. Beim Start geht es von dort weiter statt mit
+    # einem kalten Durchlauf über alle Einsätze. Was beim Schreiben gerade bearbeitet wurde (in_flight),
+    # kommt nach dem Neustart sofort und mit Vorrang wieder dran.
+    def __init__(self, path, components, interval=30, max_age=900):
+        self.path = path
+        self.components = components
+        self.interval = interval
+        self.max_age = max_age
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        # Mit MISSION_WORKERS > 1 speichern mehrere Threads, die tmp-Datei darf nur einer zur Zeit schreiben
+        self.save_lock = threading.Lock()
+        self.saved_at = time.monotonic()
+        self.saves = 0
+        self.failures = 0
+        self.loaded = False
+
+    def started(self, mission_id):
+        with self.lock:
+            self.in_flight.add(mission_id)
+
+    def finished(self, mission_id):
+        with self.lock:
+            self.in_flight.discard(mission_id)
+
+    def save(self):
+        if not self.path:
+            return False
+        with self.save_lock:
+            return self.write()
+
+    def maybe_save(self):
+        if not self.path:
+            return False
+        with self.save_lock:
+            if time.monotonic() - self.saved_at < self.interval:
+                return False
+            return self.write()
+
+    def write(self):
+        self.saved_at = time.monotonic()
+        try:
+            with self.lock:
+                in_flight = sorted(self.in_flight)
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "saved_at": time.time(),
+                "in_flight": in_flight,
+                "components": {name: component.checkpoint() for name, component in self.components.items()},
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.saves += 1
+            return True
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f"Could not write checkpoint: {e}")
+            return False
+
+    def load(self):
+        # Nur einmal pro Prozess, ein neuer Browser nach einem Fehler behält den Zustand im Speicher
+        if not self.path or self.loaded:
+            return False
+        self.loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.warning(f"Could not read checkpoint: {e}")
+            return False
+        age = time.time() - state.get("saved_at", 0)
+        if state.get("version") != CHECKPOINT_VERSION or age > self.max_age:
+            logging.info(f"Ignoring checkpoint from {age:.0f}s ago")
+            return False
+        for name, component in self.components.items():
+            if name in state.get("components", {}):
+                try:
+                    component.restore(state["components"][name])
+                except Exception as e:
+                    logging.warning(f"Could not restore {name} from checkpoint: {e}")
+        for mission_id in state.get("in_flight") or []:
+            MISSION_TRACKER.states.pop(mission_id, None)
+            MISSION_SCHEDULER.failed.add(mission_id)
+            FLEET_INDEX.observe(mission_id, None, None)
+        logging.info(
+            f"Resumed from checkpoint of {age:.0f}s ago: {len(MISSION_TRACKER.states)} tracked mission(s), "
+            f"{len(state.get('in_flight') or [])} interrupted"
+        )
+        return True
+
+    def stats(self):
+        return {"saves": self.saves, "failures": self.failures, "in_flight": len(self.in_flight)}
+
+CHECKPOINT = Checkpoint(
+    os.getenv("CHECKPOINT_FILE", "bot_checkpoint.json"),
+    {
+        "tracker": MISSION_TRACKER,
+        "scheduler": MISSION_SCHEDULER,
+        "controller": CYCLE_CONTROLLER,
+        "hospitals": HOSPITAL_CACHE,
+        "fleet": FLEET_INDEX,
+        "metrics": METRICS,
+    },
+    interval=env_number("CHECKPOINT_INTERVAL", 30),
+    max_age=env_number("CHECKPOINT_MAX_AGE", 900),
+)
+
+def run_cycle(driver, pool=None, controller=CYCLE_CONTROLLER):
+    cycle_start = time.monotonic()
+    tabs = tabs_for(driver)
+    tabs.check()
+    driver.get(f'{BASE_URL}/')
+    wait_for_ready_state(driver)
+    try:
+        finishing_button = driver.find_element(By.ID, 'mission_select_finishing')
+        finishing_button.click()
+        logging.info("Finishing filter button clicked")
+    except Exception as e:
+        logging.warning(f"Could not click finishing filter button: {str(e)}")
+    sleep(0.25)
+    wait = WebDriverWait(driver, 10)
+    READ_CLIENT.sync_from(driver)
+    # claim_rewards(driver) klappt noch nicht
+    mission_list = wait.until(EC.presence_of_element_located((By.ID, 'mission_list')))
+    mission_entries = snapshot_sidebar(driver)
+    non_finishing_missions = [
+        m for m in mission_entries
+        if m["state"] != "finishing" and "[Verband]" not in m["caption"]
+    ]
+    MISSION_HISTORY.missions_gone(set(MISSION_TRACKER.states) - {m["id"] for m in mission_entries})
+    MISSION_TRACKER.forget_missing(m["id"] for m in mission_entries)
+    FLEET_INDEX.forget_missing(m["id"] for m in mission_entries)
+    MISSION_SCHEDULER.observe_sidebar(non_finishing_missions)
+    controller.apply_speed(driver, len(non_finishing_missions))
+    if env_flag("FLEET_INDEX", True):
+        FLEET_INDEX.refresh(driver)
+    if env_flag("TRANSPORT_SWEEP", True):
+        sweep_transport_requests(driver)
+    logging.info(f"Found {len(non_finishing_missions)} non-Verband missions")
+    sleep(0.225)
+    due_missions = []
+    for mission in non_finishing_missions:
+        if "Verband" in mission["caption"]:
+            logging.info("Verband mission detected, skipping.")
+            continue
+        if not mission["url"]:
+            continue
+        if not MISSION_TRACKER.should_process(mission["id"], mission["signature"]):
+            logging.info(f"Mission {mission['id']} unchanged since last pass, skipping.")
+            continue
+        if not FLEET_INDEX.can_progress(mission["id"], mission["signature"]):
+            logging.info(f"Mission {mission['id']} still waits for vehicles without free units, skipping.")
+            continue
+        due_missions.append(mission)
+    ordered_missions = MISSION_SCHEDULER.order(due_missions)
+    deadline = MISSION_SCHEDULER.deadline()
+    if pool is not None and pool.size > 0:
+        results = pool.map(ordered_missions, deadline)
+    else:
+        results = ((mission, run_mission(driver, wait, mission, deadline)) for mission in ordered_missions)
+    deferred = 0
+    processed = 0
+    for mission, (status, outcome) in results:
+        MISSION_SCHEDULER.observe(mission, status, outcome)
+        if status == "deferred":
+            deferred += 1
+        elif status == "done":
+            processed += 1
+            FLEET_INDEX.observe(mission["id"], mission["signature"], outcome.blocked if outcome else None)
+            MISSION_TRACKER.record(mission["id"], mission["signature"], outcome.fingerprint if outcome else None)
+            METRICS.mission_done()
+    if deferred:
+        logging.info(f"Cycle time budget used up, {deferred} mission(s) carried over to the next cycle")
+    controller.update(processed, deferred, time.monotonic() - cycle_start)
+    CHECKPOINT.maybe_save()
+    logging.info(f"Mission tracker stats: {MISSION_TRACKER.stats()}")
+    logging.info(f"Mission scheduler stats: {MISSION_SCHEDULER.stats()}")
+    logging.info(f"Mission history stats: {MISSION_HISTORY.stats()}")
+    logging.info(f"Requirements cache stats: {REQUIREMENTS_CACHE.stats()}")
+    logging.info(f"HTTP read client stats: {READ_CLIENT.stats()}")
+    logging.info(f"Vehicle resolver stats: {VEHICLE_RESOLVER.metrics}")
+    logging.info(f"Hospital cache stats: {HOSPITAL_CACHE.stats()}")
+    logging.info(f"Fleet index stats: {FLEET_INDEX.stats()}")
+    logging.info(f"Checkpoint stats: {CHECKPOINT.stats()}")
+    logging.info(f"Tab stats: {tabs.stats()}")
+    logging.info(f"Wait stats: {WAIT_STATS}")
+    logging.info(f"Missions per minute: {METRICS.missions_per_minute():.2f}")
+    return mission_entries
 
 def main():
+    METRICS.open(os.getenv("METRICS_FILE", "metrics.jsonl"))
+    MISSION_HISTORY.open(os.getenv("HISTORY_DB", "mission_history.sqlite3"))
+    metrics_port = os.getenv("METRICS_PORT", "9108")
+    if metrics_port and METRICS.server is None:
+        METRICS.server = METRICS.serve(int(metrics_port))
+    driver = None
+    pool = None
+    CHECKPOINT.load()
     while True:
         try:
             email = os.getenv("EMAIL")
             password = os.getenv("PASSWORD")
-            service = Service('./chromedriver.exe')
-            driver = webdriver.Chrome(service=service)
-            sleep(0.25)
-            driver.get('https://www.leitstellenspiel.de/users/sign_in')
-            sleep(0.25)
-            email_login = driver.find_element(By.ID, 'user_email')
-            email_login.send_keys(email)
-            sleep(0.125)
-            password_login = driver.find_element(By.ID, 'user_password')
-            password_login.send_keys(password)
-            sleep(0.125)
-            user_remember_me = driver.find_element(By.ID, 'user_remember_me')
-            user_remember_me.click()
-            sleep(0.125)
-            login = driver.find_element(By.NAME, 'commit')
-            login.click()
-            sleep(0.25)
+            if driver is None or not driver_alive(driver):
+                if driver is not None:
+                    try:
+                        driver.quit()
+                    except:
+                        pass
+                driver = create_driver()
+                CYCLE_CONTROLLER.reset()
+            ensure_logged_in(driver, email, password)
+            workers = env_number("MISSION_WORKERS", 1, int)
+            if pool is None and workers > 1:
+                save_session(driver)
+                pool = MissionWorkerPool(workers)
             while True:
                 try:
-                    driver.get('https://www.leitstellenspiel.de/')
-                    sleep(0.25)
-                    try:
-                        finishing_button = driver.find_element(By.ID, 'mission_select_finishing')
-                        finishing_button.click()
-                        logging.info("Finishing filter button clicked")
-                    except Exception as e:
-                        logging.warning(f"Could not click finishing filter button: {str(e)}")
-                    sleep(0.25)
-                    wait = WebDriverWait(driver, 10)
-                    # claim_rewards(driver) klappt noch nicht
-                    mission_list = wait.until(EC.presence_of_element_located((By.ID, 'mission_list')))
-                    mission_entries = driver.find_elements(By.CLASS_NAME, 'missionSideBarEntry')
-                    non_finishing_missions = [
-                        m for m in mission_entries
-                        if (
-                            m.get_attribute("data-mission-state-filter") != "finishing" and 
-                            "[Verband]" not in m.find_element(By.CLASS_NAME, 'map_position_mover').text
+                    mission_entries = run_cycle(driver, pool)
+                    save_session(driver)
+                    poll_interval = CYCLE_CONTROLLER.poll_interval
+                    if poll_interval > 0:
+                        logging.info(f"Mission processing completed, waiting up to {poll_interval:g} seconds for new missions")
+                        # Früher aufwachen, sobald sich die Einsatzliste in der Seitenleiste ändert
+                        wait_for_element_count_change(
+                            driver, (By.CLASS_NAME, 'missionSideBarEntry'), len(mission_entries), poll_interval,
+                            name="mission_list_change"
                         )
-                    ]
-                    if len(non_finishing_missions) >= 13:
-                        set_mission_speed(driver, "pause")
-                        logging.info("Mission speed set to pause")
-                    if len(non_finishing_missions) <= 12:
-                        set_mission_speed(driver, "2")
-                        logging.info("Mission speed set to 2")
-                    logging.info(f"Found {len(non_finishing_missions)} non-Verband missions")
-                    sleep(0.225)
-                    for mission in non_finishing_missions:
-                        try:
-                            sleep(0.15)
-                            mission_caption = mission.find_element(By.CLASS_NAME, 'map_position_mover').text
-                            if "Verband" in mission_caption:
-                                logging.info("Verband mission detected, skipping.")
-                                continue
-                            sleep(0.05)
-                            alarm_button = mission.find_element(By.CLASS_NAME, 'mission-alarm-button')
-                            mission_url = alarm_button.get_attribute('href')
-                            sleep(0.03125)
-                            if mission_url:
-                                driver.execute_script(f"window.open('{mission_url}','_blank')")
-                                driver.switch_to.window(driver.window_handles[-1])
-                                sleep(0.05)
-                                if len(driver.window_handles) > 5:
-                                    logging.warning("Too many tabs open, restarting...")
-                                    driver.execute_script("window.open('https://www.leitstellenspiel.de','_blank')")
-                                    for handle in driver.window_handles[:-1]:
-                                        driver.switch_to.window(handle)
-                                        driver.close()
-                                    driver.switch_to.window(driver.window_handles[-1])
-                                    continue
-                                if check_mission_completed(driver):
-                                    driver.close()
-                                    driver.switch_to.window(driver.window_handles[0])
-                                    continue
-
-                                check_and_click_easter_egg(driver)
-                                check_for_sprechwunsch(driver, wait)
-                                select_prisoner_vehicle(driver)
-                                mission_title = wait.until(EC.presence_of_element_located((By.ID, 'missionH1')))
-                                if "Verband" in mission_title.text:
-                                    logging.info("Verband mission detected in title, closing...")
-                                    driver.close()
-                                    driver.switch_to.window(driver.window_handles[-1])
-                                    continue
-                                current_vehicles, enroute_personnel = extract_current_vehicles(driver)
-                                sleep(0.5)
-                                help_button = driver.find_element(By.ID, 'mission_help')
-                                help_url = help_button.get_attribute('href')
-                                sleep(0.03125)
-                                driver.execute_script(f"window.open('{help_url}','_blank')")
-                                driver.switch_to.window(driver.window_handles[-1])
-                                sleep(0.05)
-                                wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'col-md-4')))
-                                col_md_4_divs = driver.find_elements(By.CLASS_NAME, 'col-md-4')
-                                sleep(0.0625)
-                                if len(col_md_4_divs) >= 2:
-                                    vehicle_div = col_md_4_divs[1]
-                                    requirements_table = vehicle_div.find_element(By.TAG_NAME, 'table')
-                                    required_vehicles = extract_vehicle_requirements(requirements_table)
-                                    logging.info(f"Required vehicles: {required_vehicles}")
-                                    logging.info(f"Current vehicles: {current_vehicles}")
-                                    # required_vehicles, current_vehicles = handle_lf_and_rw_requirements(required_vehicles, current_vehicles) 
-                                    min_patients, nef_probability = extract_patient_requirements(col_md_4_divs)
-                                    sleep(0.05)
-                                    driver.close()
-                                    driver.switch_to.window(driver.window_handles[-1])
-                                    sleep(0.05)
-                                    required_vehicles = handle_patients_and_nef(
-                                        driver, required_vehicles, current_vehicles, enroute_personnel, min_patients, nef_probability
-                                    )
-                                    missing_vehicles = calculate_missing_vehicles(required_vehicles, current_vehicles)
-                                    sleep(0.05)
-                                    missing_vehicles = select_missing_personnel(driver, missing_vehicles, enroute_personnel)
-                                    sleep(0.05)
-                                    # Immer handle_water_and_dispatch aufrufen
-                                    closed_tab = handle_water_and_dispatch(driver, missing_vehicles)
-                                    if closed_tab:
-                                        logging.info("Tab closed due to insufficient LFs. Skipping further steps.")
-                                        continue
-
-                                    if missing_vehicles:
-                                        logging.info("Vehicles dispatched")
-                                        if "NEF" in missing_vehicles:
-                                            required_vehicles["NAW"] = required_vehicles.get("NAW", 0) + 1
-                                            logging.info("NEF not dispatched, dispatching NAW as backup")
-                                            select_vehicles(driver, {"NAW": 1})
-                                    else:
-                                        logging.info("No additional vehicles needed")
-                                else:
-                                    driver.close()
-                                    driver.switch_to.window(driver.window_handles[-1])
-                                    sleep(0.05)
-                                driver.close()
-                                driver.switch_to.window(driver.window_handles[0])
-                                sleep(0.125)
-                        except Exception as e:
-                            if ("unexpected alert open" in str(e).lower()
-                                or "no such element" in str(e).lower()
-                                or "element not found" in str(e).lower()):
-                                try:
-                                    Alert(driver).accept()
-                                    Alert(driver).send_keys("Enter")
-                                    sleep(0.05)
-                                except:
-                                    pass
-                                continue
-                            logging.error(f"Error processing mission: {str(e)}")
-                            continue
-                    logging.info("Mission processing completed, waiting 20 seconds")
-                    sleep(20)
                 except Exception as e:
                     logging.error(f"Error in mission loop: {str(e)}")
                     try:
-                        driver.get('https://www.leitstellenspiel.de/')
+                        driver.get(f'{BASE_URL}/')
+                        wait_for_element(driver, (By.ID, 'mission_list'), timeout=30, name="recovery")
                     except:
-                        pass
-                    sleep(30)
+                        sleep(30)
                     continue
         except Exception as e:
             logging.error(f"Critical error occurred: {str(e)}")
+            CHECKPOINT.save()
             try:
-                driver.execute_script("window.open('https://www.leitstellenspiel.de','_blank')")
-                for handle in driver.window_handles[:-1]:
-                    driver.switch_to.window(handle)
-                    driver.close()
-                driver.switch_to.window(driver.window_handles[-1])
+                # Nur fremde Tabs schließen, die eigenen (Leitstelle, Einsatz, ...) bleiben offen
+                tabs_for(driver).check()
             except:
                 pass
             sleep(25)
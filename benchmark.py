@@ -0,0 +1,440 @@
+# Offline-Benchmark: startet einen lokalen Stand-in-Server, der die Endpunkte nachbildet,
+# die main() benutzt, und fährt run_cycle() mit headless Chrome dagegen.
+#
+#   python benchmark.py --missions 15 --cycles 3
+#   python benchmark.py --pages recorded/ --json
+#   python benchmark.py --profile default   # Vergleich mit vollem Seitenaufbau
+#
+# Läuft ohne Netzwerk, solange ein chromedriver im PATH liegt (oder per --chromedriver).
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+MISSION_TYPES = [
+    {"id": 1, "name": "Brennender PKW", "vehicles": [("Benötigte Löschfahrzeuge", 1)], "patients": 0, "nef": 0},
+    {"id": 2, "name": "Zimmerbrand", "vehicles": [("Benötigte Löschfahrzeuge", 2), ("Benötigte Drehleitern", 1)], "patients": 1, "nef": 20},
+    {"id": 3, "name": "Verkehrsunfall", "vehicles": [("Benötigte Löschfahrzeuge", 1), ("Benötigte Rüstwagen", 1)], "patients": 2, "nef": 50},
+    {"id": 4, "name": "Gefahrgutunfall", "vehicles": [("Benötigte Löschfahrzeuge", 3), ("Benötigte GW-Gefahrgut", 1), ("Benötigte ELW 1", 1)], "patients": 0, "nef": 0},
+    {"id": 5, "name": "Großbrand", "vehicles": [("Benötigte Löschfahrzeuge", 6), ("Benötigte Drehleitern", 2), ("Benötigte ELW 1", 1), ("Benötigte Schlauchwagen", 1)], "patients": 3, "nef": 30},
+]
+
+# (search_attribute, verfügbare Fahrzeuge, Wasser in Litern)
+AAO = [
+    ("LF", 12, 2000), ("DLK", 3, 0), ("RW", 2, 0), ("ELW", 3, 0), ("GW-G", 1, 0), ("GW-L2", 1, 2000),
+    ("RTW", 8, 0), ("NEF", 3, 0), ("NAW", 1, 0), ("KdoW LNA", 1, 0), ("KdoW OrgL", 1, 0), ("ELW 1 (SEG)", 1, 0),
+]
+
+PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title></head><body>{body}</body></html>"""
+
+AAO_SCRIPT = """<script>
+document.querySelectorAll('.aao_searchable').forEach(function (a) {
+    a.addEventListener('click', function (e) {
+        e.preventDefault();
+        var span = a.querySelector('span');
+        var left = parseInt(span.textContent) - 1;
+        span.textContent = left;
+        if (left <= 0) { span.className = 'label label-danger'; }
+        var bar = document.querySelector('.progress-bar-mission-window-water');
+        if (bar) {
+            var missing = parseInt(bar.dataset.missing) - parseInt(a.dataset.water || 0);
+            bar.dataset.missing = missing;
+            bar.textContent = missing > 0 ? 'Fehlen: ' + missing.toLocaleString('de-DE') + ' l.' : '';
+        }
+    });
+});
+</script>"""
+
+
+class StandInGame:
+    def __init__(self, missions, seed=1):
+        rng = random.Random(seed)
+        self.missions = {}
+        for mission_id in range(1, missions + 1):
+            mission_type = rng.choice(MISSION_TYPES)
+            self.missions[mission_id] = {
+                "type": mission_type,
+                "driving": rng.randint(0, 3),
+                "at_mission": rng.randint(0, 3),
+                "patients": mission_type["patients"] + rng.randint(0, 2),
+                "water": rng.choice([0, 0, 1500, 4000]),
+                "personnel": rng.choice([0, 0, 5]),
+                "sprechwunsch": rng.random() < 0.2,
+                "prisoner": rng.random() < 0.1,
+            }
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def sign_in_page(self):
+        return PAGE.format(title="Login", body="""
+<form method="post" action="/users/sign_in">
+<input id="user_email" name="user[email]"><input id="user_password" name="user[password]" type="password">
+<input id="user_remember_me" type="checkbox"><input type="submit" name="commit" value="Einloggen">
+</form>""")
+
+    def index_page(self):
+        entries = []
+        for mission_id, mission in self.missions.items():
+            entries.append(
+                f'<div class="missionSideBarEntry" id="mission_{mission_id}" '
+                f'mission_type_id="{mission["type"]["id"]}" data-mission-state-filter="red">'
+                f'<a class="map_position_mover">{mission["type"]["name"]} #{mission_id}</a>'
+                f'<a class="btn mission-alarm-button" href="/missions/{mission_id}">Alarm</a></div>'
+            )
+        return PAGE.format(title="Leitstelle", body=f"""
+<a id="mission_select_finishing" href="#">Finishing</a>
+<div id="mission_speed_pause" style="display: none"></div>
+<div id="mission_list">{''.join(entries)}</div>""")
+
+    def mission_page(self, mission_id):
+        mission = self.missions.get(mission_id)
+        if mission is None:
+            return None
+        rows_driving = "".join(
+            f"<tr><td></td><td>Florian {i} (LF 20)</td><td>9</td></tr>" for i in range(mission["driving"])
+        )
+        rows_at_mission = "".join(
+            f"<tr><td></td><td>Rettung {i} (RTW)</td><td>2</td></tr>" for i in range(mission["at_mission"])
+        )
+        patients = "".join(
+            '<div class="mission_patient"><div class="alert alert-danger">Wir benötigen: NEF</div></div>'
+            if i % 2 == 0 else '<div class="mission_patient"></div>'
+            for i in range(mission["patients"])
+        )
+        alerts = ""
+        if mission["sprechwunsch"]:
+            alerts += f'<div class="alert alert-danger">Sprechwunsch: <a href="/vehicles/{mission_id}">RTW</a></div>'
+        if mission["personnel"]:
+            alerts += (
+                '<div class="alert alert-missing-vehicles"><div data-requirement-type="personnel">'
+                f'Fehlendes Personal: {mission["personnel"]} Feuerwehrleute</div></div>'
+            )
+        if mission["prisoner"]:
+            alerts += (
+                f'<div class="vehicle_prisoner_select"><a class="btn btn-success" href="/vehicles/{mission_id}/gefangener/1">'
+                'Zelle 1</a></div>'
+            )
+        water = ""
+        if mission["water"]:
+            water = (
+                f'<div class="progress-bar progress-bar-missing progress-bar-mission-window-water" '
+                f'data-missing="{mission["water"]}">Fehlen: {mission["water"]:,} l.</div>'.replace(",", ".")
+            )
+        aao = "".join(
+            f'<a href="#" class="aao_searchable" search_attribute="{name}" data-water="{litres}">'
+            f'<span id="available_aao_{i}" class="label label-success">{available}</span> {name}</a>'
+            for i, (name, available, litres) in enumerate(AAO)
+        )
+        return PAGE.format(title=f"Einsatz {mission_id}", body=f"""
+<h1 id="missionH1">{mission["type"]["name"]}</h1>
+<a id="mission_help" href="/einsaetze/{mission["type"]["id"]}?mission_id={mission_id}">Hilfe</a>
+<div id="col_left">{alerts}{patients}{water}</div>
+<table id="mission_vehicle_driving"><tr><th>Fahrzeug</th></tr>{rows_driving}</table>
+<table id="mission_vehicle_at_mission"><tr><th>Fahrzeug</th></tr>{rows_at_mission}</table>
+<form method="post" action="/missions/{mission_id}/alarm">{aao}
+<input type="submit" id="mission_alarm_btn" value="Alarmieren"></form>{AAO_SCRIPT}""")
+
+    def help_page(self, type_id):
+        mission_type = next((t for t in MISSION_TYPES if t["id"] == type_id), None)
+        if mission_type is None:
+            return None
+        vehicles = "".join(f"<tr><td>{name}</td><td>{count}</td></tr>" for name, count in mission_type["vehicles"])
+        return PAGE.format(title="Hilfe", body=f"""
+<div class="col-md-4"><table><tr><td>Credits im Durchschnitt</td><td>500</td></tr></table></div>
+<div class="col-md-4"><table><tr><th>Fahrzeuge</th></tr>{vehicles}</table></div>
+<div class="col-md-4"><table>
+<tr><td>Mindest Patientenanzahl</td><td>{mission_type["patients"]}</td></tr>
+<tr><td>NEF Anforderungswahrscheinlichkeit</td><td>{mission_type["nef"]}</td></tr>
+</table></div>""")
+
+    def hospital_page(self, vehicle_id):
+        return PAGE.format(title="Krankenhaus", body=f"""
+<table id="own-hospitals">
+<tr><th>Krankenhaus</th><th>Entfernung</th><th>Freie Betten</th><th>Fachabteilung vorhanden</th><th></th></tr>
+<tr><td>KH Nord</td><td>2,1 km</td><td>0</td><td>Ja</td><td><a class="btn btn-danger" href="#">Voll</a></td></tr>
+<tr><td>KH Süd</td><td>5,4 km</td><td>12</td><td>Nein</td>
+<td><a class="btn btn-success" href="/vehicles/{vehicle_id}/patient/2">Anfahren</a></td></tr>
+<tr><td>KH West</td><td>7,9 km</td><td>3</td><td>Ja</td>
+<td><a class="btn btn-success" href="/vehicles/{vehicle_id}/patient/3">Anfahren</a></td></tr>
+</table>""")
+
+    def plain_page(self, title):
+        return PAGE.format(title=title, body=f"<p>{title}</p>")
+
+
+def make_handler(game, pages_dir=None):
+    class Handler(BaseHTTPRequestHandler):
+        def send_html(self, html, status=200):
+            body = html.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def redirect(self, location):
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def recorded_page(self, path):
+            if not pages_dir:
+                return None
+            name = path.strip("/") or "index"
+            file_path = os.path.join(pages_dir, name + ".html")
+            if os.path.isfile(file_path):
+                with open(file_path, encoding="utf-8") as f:
+                    return f.read()
+            return None
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            recorded = self.recorded_page(path)
+            if recorded is not None:
+                game.count("recorded")
+                return self.send_html(recorded)
+            if path == "/users/sign_in":
+                game.count("sign_in")
+                return self.send_html(game.sign_in_page())
+            if path == "/":
+                game.count("index")
+                return self.send_html(game.index_page())
+            if path == "/missionSpeed":
+                game.count("mission_speed")
+                return self.redirect("/")
+            match = re.fullmatch(r"/missions/(\d+)", path)
+            if match:
+                game.count("mission")
+                html = game.mission_page(int(match.group(1)))
+                return self.send_html(html) if html else self.send_html("not found", 404)
+            match = re.fullmatch(r"/einsaetze/(\d+)", path)
+            if match:
+                game.count("help")
+                html = game.help_page(int(match.group(1)))
+                return self.send_html(html) if html else self.send_html("not found", 404)
+            match = re.fullmatch(r"/vehicles/(\d+)", path)
+            if match:
+                game.count("hospitals")
+                return self.send_html(game.hospital_page(int(match.group(1))))
+            if re.fullmatch(r"/vehicles/\d+/(patient|gefangener)/\d+", path):
+                game.count("transport")
+                return self.send_html(game.plain_page("Transport"))
+            game.count("other")
+            return self.send_html(game.plain_page("Leitstelle"))
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            length = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(length)
+            if path == "/users/sign_in":
+                game.count("sign_in_post")
+                self.send_response(302)
+                self.send_header("Set-Cookie", "_session_id=benchmark; Path=/")
+                self.send_header("Location", "/")
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            match = re.fullmatch(r"/missions/(\d+)/alarm", path)
+            if match:
+                game.count("alarm")
+                return self.redirect(f"/missions/{match.group(1)}")
+            return self.send_html("not found", 404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(game, pages_dir=None, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(game, pages_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def process_tree_rss(root_pid, include_root=True):
+    # Summe der RSS aller Prozesse unterhalb von root_pid (chromedriver + Chrome), nur Linux.
+    # Der Benchmark misst ab seinem eigenen Prozess, damit auch die Browser der Worker mitzählen.
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        if pid == root_pid and not include_root:
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class PeakMemorySampler:
+    def __init__(self, root_pid, interval=0.2):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.root_pid, include_root=False))
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def count_commands_into(driver, counts, lock=threading.Lock()):
+    execute = driver.execute
+
+    def counting_execute(driver_command, params=None):
+        with lock:
+            counts[driver_command] = counts.get(driver_command, 0) + 1
+        return execute(driver_command, params)
+
+    driver.execute = counting_execute
+    return counts
+
+
+def count_commands(driver):
+    return count_commands_into(driver, {})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark against a local stand-in game server")
+    parser.add_argument("--missions", type=int, default=15, help="number of generated missions in the sidebar")
+    parser.add_argument("--cycles", type=int, default=3, help="number of run_cycle() passes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--pages", help="directory of recorded HTML pages served instead of generated ones")
+    parser.add_argument("--chromedriver", default=shutil.which("chromedriver"), help="path to chromedriver")
+    parser.add_argument("--chrome-binary", help="path to the Chrome/Chromium binary")
+    parser.add_argument("--profile", default="lean", help="browser profile from app.BROWSER_PROFILES")
+    parser.add_argument("--workers", type=int, default=1, help="concurrent mission workers (MISSION_WORKERS)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def run_benchmark(args):
+    game = StandInGame(args.missions, seed=args.seed)
+    server = start_server(game, args.pages)
+    workdir = tempfile.mkdtemp(prefix="lss-bench-")
+    # app liest seine Konfiguration beim Import, deshalb erst hier importieren
+    os.environ["LSS_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["REQUIREMENTS_CACHE_FILE"] = os.path.join(workdir, "requirements_cache.json")
+    os.environ["SESSION_COOKIES_FILE"] = os.path.join(workdir, "session_cookies.json")
+    os.environ["CHECKPOINT_FILE"] = os.path.join(workdir, "bot_checkpoint.json")
+    import app
+
+    settings = app.browser_settings(args.profile)
+    # Der Benchmark läuft immer ohne Fenster, auch mit dem default-Profil
+    settings.update(headless=True, driver_path=args.chromedriver, binary=args.chrome_binary)
+    settings["extra_args"] += ["--no-sandbox", "--disable-dev-shm-usage"]
+    driver = app.create_driver(settings)
+    pool = None
+    try:
+        commands = count_commands(driver)
+        app.login(driver, "bench@example.invalid", "bench")
+        if args.workers > 1:
+            app.save_session(driver)
+            pool = app.MissionWorkerPool(args.workers, settings)
+            for worker_driver in list(pool.drivers.queue):
+                if worker_driver is not None:
+                    count_commands_into(worker_driver, commands)
+        commands.clear()
+        missions_before = app.METRICS.missions_total
+        with PeakMemorySampler(os.getpid()) as sampler:
+            start = time.monotonic()
+            for _ in range(args.cycles):
+                app.run_cycle(driver, pool)
+            elapsed = time.monotonic() - start
+        missions = app.METRICS.missions_total - missions_before
+    finally:
+        if pool is not None:
+            pool.close()
+        driver.quit()
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total_commands = sum(commands.values())
+    return {
+        "profile": args.profile,
+        "workers": args.workers,
+        "missions": missions,
+        "cycles": args.cycles,
+        "elapsed_seconds": round(elapsed, 3),
+        "missions_per_minute": round(missions * 60.0 / elapsed, 2) if elapsed else 0.0,
+        "webdriver_commands": total_commands,
+        "webdriver_commands_per_mission": round(total_commands / missions, 1) if missions else 0.0,
+        "top_commands": dict(sorted(commands.items(), key=lambda item: -item[1])[:10]),
+        "peak_browser_rss_mb": round(sampler.peak / 2**20, 1),
+        "server_requests": dict(game.requests),
+        "phases": {
+            phase: {key: round(value, 4) for key, value in stats.items()}
+            for phase, stats in app.METRICS.summary().items()
+        },
+        "requirements_cache": app.REQUIREMENTS_CACHE.stats(),
+    }
+
+
+def print_report(report):
+    print(f"browser profile         {report['profile']} ({report['workers']} worker(s))")
+    print(f"missions processed      {report['missions']} in {report['cycles']} cycles ({report['elapsed_seconds']}s)")
+    print(f"missions/minute         {report['missions_per_minute']}")
+    print(f"webdriver cmds/mission  {report['webdriver_commands_per_mission']} ({report['webdriver_commands']} total)")
+    print(f"peak browser RSS        {report['peak_browser_rss_mb']} MB")
+    print(f"server requests         {report['server_requests']}")
+    print(f"requirements cache      {report['requirements_cache']}")
+    print("phase                    p50       p95       p99     count")
+    for phase, stats in sorted(report["phases"].items()):
+        print(f"{phase:<20} {stats['p50']:>8.3f}  {stats['p95']:>8.3f}  {stats['p99']:>8.3f}  {stats['count']:>8}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.chromedriver:
+        print("chromedriver not found, pass --chromedriver", file=sys.stderr)
+        return 2
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
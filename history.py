@@ -0,0 +1,239 @@
+# Verlauf aller Einsatz-Durchläufe in SQLite: pro Einsatz eine Zeile, pro Durchlauf eine Zeile
+# (Anforderungen, vorhandene Fahrzeuge, Plan, Alarmierung, Phasenzeiten) und pro angeforderter
+# Fahrzeugart eine Zeile mit dem Ergebnis der Auswahl. Geschrieben wird gesammelt in einem
+# Hintergrund-Thread, der Hauptloop stellt nur in eine Queue.
+#
+#   python history.py slowest          langsamste Einsatztypen
+#   python history.py passes           Durchläufe bis zum Abschluss
+#   python history.py dispatch         Erfolgsquote der Auswahl pro Fahrzeugart
+import argparse
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS missions (
+    mission_id TEXT PRIMARY KEY,
+    mission_type TEXT,
+    caption TEXT,
+    first_seen REAL,
+    last_seen REAL,
+    passes INTEGER NOT NULL DEFAULT 0,
+    completed_at REAL
+);
+CREATE TABLE IF NOT EXISTS passes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mission_id TEXT NOT NULL,
+    mission_type TEXT,
+    started_at REAL NOT NULL,
+    duration REAL,
+    status TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    alarmed INTEGER NOT NULL DEFAULT 0,
+    required TEXT,
+    present TEXT,
+    planned TEXT,
+    phases TEXT
+);
+CREATE TABLE IF NOT EXISTS dispatches (
+    pass_id INTEGER NOT NULL REFERENCES passes(id),
+    mission_type TEXT,
+    vehicle_type TEXT NOT NULL,
+    requested INTEGER NOT NULL,
+    selected INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS passes_mission ON passes(mission_id);
+CREATE INDEX IF NOT EXISTS passes_type ON passes(mission_type);
+CREATE INDEX IF NOT EXISTS dispatches_vehicle ON dispatches(vehicle_type);
+"""
+
+class MissionHistory:
+    def __init__(self, path=None, batch_size=50, flush_interval=2.0, background=True):
+        self.path = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.background = background
+        self.queue = queue.Queue()
+        self.written = 0
+        self.dropped = 0
+        self.thread = None
+        self.open(path)
+
+    def open(self, path):
+        # Ohne path (oder bis open() aufgerufen wird) werden Durchläufe verworfen
+        if not path or self.path is not None:
+            return
+        self.path = path
+        connection = self.connect()
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+        if self.background:
+            self.thread = threading.Thread(target=self.writer, name="mission-history", daemon=True)
+            self.thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record_pass(self, record):
+        if self.thread is not None:
+            self.queue.put(("pass", record))
+
+    def missions_gone(self, mission_ids, now=None):
+        # Aus der Seitenleiste verschwunden = abgeschlossen
+        mission_ids = list(mission_ids)
+        if self.thread is not None and mission_ids:
+            self.queue.put(("gone", (mission_ids, time.time() if now is None else now)))
+
+    def writer(self):
+        connection = self.connect()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = any(kind == "stop" for kind, _ in batch)
+            try:
+                with connection:
+                    for kind, payload in batch:
+                        if kind == "pass":
+                            self.write_pass(connection, payload)
+                        elif kind == "gone":
+                            self.write_gone(connection, *payload)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logging.warning(f"Could not write mission history: {e}")
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    @staticmethod
+    def write_pass(connection, record):
+        started_at = record["started_at"]
+        connection.execute(
+            "INSERT INTO missions (mission_id, mission_type, caption, first_seen, last_seen, passes) "
+            "VALUES (?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT(mission_id) DO UPDATE SET last_seen = excluded.last_seen, passes = passes + 1, "
+            "mission_type = COALESCE(excluded.mission_type, mission_type)",
+            (record["mission_id"], record.get("mission_type"), record.get("caption"), started_at, started_at),
+        )
+        cursor = connection.execute(
+            "INSERT INTO passes (mission_id, mission_type, started_at, duration, status, completed, alarmed, "
+            "required, present, planned, phases) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["mission_id"], record.get("mission_type"), started_at, record.get("duration"),
+                record.get("status"), int(bool(record.get("completed"))), int(bool(record.get("alarmed"))),
+                json.dumps(record.get("required"), ensure_ascii=False),
+                json.dumps(record.get("present"), ensure_ascii=False),
+                json.dumps(record.get("planned"), ensure_ascii=False),
+                json.dumps(record.get("phases"), ensure_ascii=False),
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO dispatches (pass_id, mission_type, vehicle_type, requested, selected) VALUES (?, ?, ?, ?, ?)",
+            [
+                (cursor.lastrowid, record.get("mission_type"), vehicle_type, requested, selected)
+                for vehicle_type, requested, selected in record.get("dispatches", [])
+            ],
+        )
+        if record.get("completed"):
+            connection.execute(
+                "UPDATE missions SET completed_at = ? WHERE mission_id = ? AND completed_at IS NULL",
+                (started_at, record["mission_id"]),
+            )
+
+    @staticmethod
+    def write_gone(connection, mission_ids, now):
+        connection.executemany(
+            "UPDATE missions SET completed_at = ? WHERE mission_id = ? AND completed_at IS NULL",
+            [(now, mission_id) for mission_id in mission_ids],
+        )
+
+    def flush(self):
+        if self.thread is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(("stop", None))
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def query(self, sql, params=()):
+        connection = self.connect()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def slowest_mission_types(self, limit=10):
+        return self.query(
+            "SELECT mission_type, COUNT(*), AVG(duration), MAX(duration) FROM passes "
+            "WHERE status = 'done' AND duration IS NOT NULL GROUP BY mission_type "
+            "ORDER BY AVG(duration) DESC LIMIT ?",
+            (limit,),
+        )
+
+    def passes_to_completion(self, limit=10):
+        return self.query(
+            "SELECT mission_type, COUNT(*), AVG(passes), MAX(passes) FROM missions "
+            "WHERE completed_at IS NOT NULL GROUP BY mission_type ORDER BY AVG(passes) DESC LIMIT ?",
+            (limit,),
+        )
+
+    def average_passes_to_completion(self):
+        row = self.query("SELECT AVG(passes) FROM missions WHERE completed_at IS NOT NULL")[0]
+        return row[0] or 0.0
+
+    def dispatch_success_rate(self, limit=50):
+        return self.query(
+            "SELECT vehicle_type, SUM(requested), SUM(selected), "
+            "CAST(SUM(MIN(selected, requested)) AS REAL) / SUM(requested) FROM dispatches "
+            "WHERE requested > 0 GROUP BY vehicle_type ORDER BY 4 ASC LIMIT ?",
+            (limit,),
+        )
+
+def print_table(headers, rows):
+    rows = [[f"{value:.3f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the mission history database.")
+    parser.add_argument("--db", default=os.getenv("HISTORY_DB", "mission_history.sqlite3"), help="SQLite file")
+    parser.add_argument("--limit", type=int, default=10, help="number of rows")
+    parser.add_argument("query", choices=["slowest", "passes", "dispatch"])
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} does not exist")
+    history = MissionHistory(args.db, background=False)
+    if args.query == "slowest":
+        print_table(["mission_type", "passes", "avg_s", "max_s"], history.slowest_mission_types(args.limit))
+    elif args.query == "passes":
+        print(f"Average passes to completion: {history.average_passes_to_completion():.2f}")
+        print_table(["mission_type", "missions", "avg_passes", "max_passes"], history.passes_to_completion(args.limit))
+    else:
+        print_table(["vehicle_type", "requested", "selected", "success_rate"], history.dispatch_success_rate(args.limit))
+
+if __name__ == "__main__":
+    main()
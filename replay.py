@@ -0,0 +1,157 @@
+# Spielt einen mit RECORD_DIR aufgenommenen Korpus ohne Browser durch die Parser und Planer aus app.py
+# und gibt pro Durchlauf die Entscheidungen (Anforderungen, fehlende Fahrzeuge, Wasserplan,
+# Krankenhaus) sowie die Laufzeit pro Funktion aus. Mit --save/--expect als Regressionstest:
+#
+#   python replay.py recorded/
+#   python replay.py recorded/ --save baseline.json
+#   python replay.py recorded/ --expect baseline.json --repeat 20
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+# app liest seine Konfiguration beim Import: kein Anforderungs-Cache von der Platte, kein Checkpoint,
+# kein Aufnehmen (Metrik- und Verlaufsdateien öffnet erst app.main())
+for name in ("RECORD_DIR", "REQUIREMENTS_CACHE_FILE", "CHECKPOINT_FILE"):
+    os.environ[name] = ""
+os.environ["READ_VIA_HTTP"] = "0"
+
+import app
+
+def load_corpus(directory):
+    for path in sorted(glob.glob(os.path.join(directory, "*", "*.json.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        entry["path"] = os.path.relpath(path, directory)
+        yield entry
+
+def page(entry, kind):
+    return [p for p in entry.get("pages") or [] if p["kind"] == kind]
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+
+    def run(self, name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self):
+        result = {}
+        for name, values in self.samples.items():
+            values = sorted(values)
+            result[name] = {
+                "count": len(values),
+                "median_ms": statistics.median(values) * 1000,
+                "p95_ms": values[max(0, int(len(values) * 0.95 + 0.5) - 1)] * 1000,
+                "total_ms": sum(values) * 1000,
+            }
+        return result
+
+def replay_pass(entry, timings):
+    missions = page(entry, "mission")
+    helps = page(entry, "help")
+    if not missions or not helps:
+        return None
+    tree = timings.run("parse_html", app.parse_html, missions[0]["html"])
+    help_tree = timings.run("parse_html", app.parse_html, helps[0]["html"])
+    snapshot = timings.run("parse_mission_vehicles", app.parse_mission_vehicles, tree)
+    current_vehicles, enroute_personnel = timings.run("count_current_vehicles", app.count_current_vehicles, snapshot)
+    requirements = timings.run("parse_help_page", app.parse_help_page, help_tree)
+    if requirements is None:
+        return None
+    patient_snapshot = timings.run("parse_patient_snapshot", app.parse_patient_snapshot, tree)
+    scan = timings.run("classify_patients", app.classify_patients, patient_snapshot)
+    required_vehicles = timings.run(
+        "handle_patients_and_nef", app.plan_patient_vehicles,
+        requirements.vehicles, current_vehicles, enroute_personnel,
+        requirements.min_patients, requirements.nef_probability, scan,
+    )
+    aao_index = timings.run("parse_aao_index", app.parse_aao_index, tree)
+    available = timings.run("aao_availability", app.aao_availability, required_vehicles, aao_index)
+    missing_vehicles = timings.run(
+        "calculate_missing_vehicles", app.calculate_missing_vehicles, required_vehicles, current_vehicles, available
+    )
+    missing_personnel = timings.run("parse_missing_personnel", app.parse_missing_personnel, tree)
+    missing_vehicles = timings.run(
+        "select_missing_personnel", app.add_personnel_vehicles, missing_vehicles, missing_personnel, enroute_personnel
+    )
+    missing_water = timings.run("parse_missing_water", app.parse_missing_water, tree)
+    # Ohne Browser gibt es keine Auswahl: angenommen wird, dass alles Geplante ausgewählt wird
+    remaining_water = app.water_still_missing(missing_water, missing_vehicles)
+    water_plan = timings.run("plan_water_dispatch", app.plan_water_dispatch, remaining_water, aao_index)
+    hospitals = []
+    for hospital in page(entry, "hospital"):
+        hospital_tree = timings.run("parse_html", app.parse_html, hospital["html"])
+        hospitals.append(timings.run("parse_hospital_choice", app.parse_hospital_choice, hospital_tree, hospital["url"]))
+    return {
+        "current": dict(current_vehicles),
+        "enroute_personnel": enroute_personnel,
+        "required": dict(required_vehicles),
+        "missing": dict(missing_vehicles),
+        "water_plan": water_plan,
+        "hospitals": hospitals,
+    }
+
+def compare(decisions, expected):
+    differences = []
+    for key in sorted(set(decisions) | set(expected)):
+        if decisions.get(key) != expected.get(key):
+            differences.append({"pass": key, "expected": expected.get(key), "actual": decisions.get(key)})
+    return differences
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded corpus through the parsers and planners.")
+    parser.add_argument("corpus", help="directory written with RECORD_DIR")
+    parser.add_argument("--repeat", type=int, default=1, help="replay every pass this many times for timings")
+    parser.add_argument("--save", help="write the decisions to this JSON file")
+    parser.add_argument("--expect", help="compare the decisions with this JSON file, exit 1 on differences")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the log output of app.py")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.ERROR)
+    timings = Timings()
+    decisions = {}
+    skipped = 0
+    for entry in load_corpus(args.corpus):
+        for _ in range(max(1, args.repeat)):
+            result = replay_pass(entry, timings)
+        if result is None:
+            skipped += 1
+            continue
+        # JSON-Roundtrip, damit der Vergleich mit --expect dieselben Typen sieht
+        decisions[entry["path"]] = json.loads(json.dumps(result, ensure_ascii=False))
+    report = {"passes": len(decisions), "skipped": skipped, "timings": timings.report()}
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(decisions, f, ensure_ascii=False, indent=1, sort_keys=True)
+    differences = []
+    if args.expect:
+        with open(args.expect, encoding="utf-8") as f:
+            differences = compare(decisions, json.load(f))
+        report["differences"] = differences
+    if args.json:
+        report["decisions"] = decisions
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+    else:
+        print(f"Replayed {len(decisions)} pass(es), skipped {skipped} without mission/help page")
+        print(f"{'function':32} {'count':>7} {'median ms':>10} {'p95 ms':>10} {'total ms':>10}")
+        for name, stats in sorted(report["timings"].items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"{name:32} {stats['count']:7d} {stats['median_ms']:10.3f} {stats['p95_ms']:10.3f} {stats['total_ms']:10.1f}")
+        for difference in differences:
+            print(f"DIFF {difference['pass']}: expected {difference['expected']}, got {difference['actual']}")
+    return 1 if differences else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+import app
+
+TYPES = ["RTW", "NEF", "NAW", "HLF 20", "LF", "RW", "ELW 1", "FuStW"]
+# Typen, die keine Zeile in SUBSTITUTIONS abdecken kann
+DIRECT_ONLY = [t for t in TYPES if not any(t in covers for _, covers in app.SUBSTITUTIONS)]
+
+def random_counts(rng, high):
+    return {t: rng.randint(0, high) for t in TYPES if rng.random() < 0.6}
+
+def random_case(seed):
+    rng = random.Random(seed)
+    required = random_counts(rng, 4)
+    current = random_counts(rng, 3)
+    available = None if rng.random() < 0.2 else random_counts(rng, 4)
+    costs = {t: rng.choice([0.5, 1.0, 1.5, 2.0, 3.0]) for t in ("RTW", "NEF", "NAW")} if rng.random() < 0.5 else {}
+    return required, current, available, costs
+
+def score(plan):
+    sent = sum(plan.vehicles.values()) - sum(plan.unmet.values())
+    return plan.cost + app.UNMET_PENALTY * sum(plan.unmet.values()), sent
+
+def deficit(required, current, vehicle_type):
+    return max(0, required.get(vehicle_type, 0) - current.get(vehicle_type, 0))
+
+def spare(required, current, vehicle_type):
+    return max(0, current.get(vehicle_type, 0) - required.get(vehicle_type, 0))
+
+CASES = [random_case(seed) for seed in range(500)]
+
+@pytest.mark.parametrize("required, current, available, costs", CASES)
+def test_direct_only_deficits_are_covered(required, current, available, costs):
+    plan = app.plan_dispatch(required, current, available, costs=costs)
+    for vehicle_type in DIRECT_ONLY:
+        assert plan.vehicles.get(vehicle_type, 0) >= deficit(required, current, vehicle_type)
+
+@pytest.mark.parametrize("required, current, available, costs", CASES)
+def test_plan_stays_within_availability(required, current, available, costs):
+    plan = app.plan_dispatch(required, current, available, costs=costs)
+    if available is None:
+        return
+    for vehicle_type, count in plan.vehicles.items():
+        assert count - plan.unmet.get(vehicle_type, 0) <= available.get(vehicle_type, 0)
+
+@pytest.mark.parametrize("required, current, available, costs", CASES)
+def test_present_substitutes_are_used_first(required, current, available, costs):
+    plan = app.plan_dispatch(required, current, available, costs=costs)
+    # Überzählige HLF 20 übernehmen je eine offene RW/LF-Anforderung, bevor etwas alarmiert wird
+    hlf_spare = spare(required, current, "HLF 20")
+    if hlf_spare:
+        roles = deficit(required, current, "RW") + deficit(required, current, "LF")
+        sent = sum(plan.vehicles.get(t, 0) for t in ("RW", "LF", "HLF 20"))
+        assert sent == max(0, roles - hlf_spare)
+    # Überzählige NAW zählen als RTW und NEF zugleich
+    naw_spare = spare(required, current, "NAW")
+    if naw_spare:
+        rtw = max(0, deficit(required, current, "RTW") - naw_spare)
+        nef = max(0, deficit(required, current, "NEF") - naw_spare)
+        assert plan.vehicles.get("RTW", 0) <= rtw
+        assert plan.vehicles.get("NEF", 0) <= nef
+        assert plan.vehicles.get("NAW", 0) <= max(rtw, nef)
+
+@pytest.mark.parametrize("required, current, available, costs", CASES)
+def test_naw_only_when_cheaper_than_rtw_and_nef(required, current, available, costs):
+    plan = app.plan_dispatch(required, current, available, costs=costs)
+    if plan.vehicles.get("NAW", 0) <= deficit(required, current, "NAW"):
+        return
+    without_naw = [row for row in app.SUBSTITUTIONS if row[0] != "NAW"]
+    alternative = app.plan_dispatch(required, current, available, substitutions=without_naw, costs=costs)
+    assert score(plan) < score(alternative)
+
+def test_present_rtw_is_subtracted_once():
+    scan = app.PatientScan(3, [(), (), ()], {}, [])
+    required = app.plan_patient_vehicles({}, {"RTW": 1}, 0, 0, 0, scan)
+    missing = app.calculate_missing_vehicles(required, {"RTW": 1})
+    assert missing.get("RTW") == 2
+
+def test_single_naw_keeps_remaining_rtws():
+    scan = app.classify_patients({"patients": [["NEF benötigt"], [], []]})
+    required = app.plan_patient_vehicles({}, {}, 0, 0, 0, scan)
+    missing = app.calculate_missing_vehicles(required, {})
+    assert missing.get("RTW", 0) + missing.get("NAW", 0) == 3
+    assert missing.get("NEF", 0) + missing.get("NAW", 0) >= 1
+
+def test_tragehilfe_keeps_larger_lf_requirement():
+    scan = app.classify_patients({"patients": [["Tragehilfe benötigt"]]})
+    required = app.plan_patient_vehicles({"LF": 3}, {}, 0, 0, 0, scan)
+    assert required.get("LF") == 3
+    assert app.calculate_missing_vehicles(required, {}).get("LF") == 3
+
+def test_scheduler_gets_parsed_patient_count(monkeypatch):
+    scan = app.classify_patients({"patients": [["NEF benötigt"], [], []]})
+    monkeypatch.setattr(app, "extract_patients", lambda driver: scan)
+    required, patients = app.handle_patients_and_nef(None, {"RTW": 1}, {"NAW": 1, "RTW": 1}, 0, 1, 0)
+    assert patients == 3
+    required, patients = app.handle_patients_and_nef(None, {}, {}, 0, 5, 0)
+    assert patients == 5
@@ -0,0 +1,37 @@
+import pytest
+
+import app
+
+class FakeResponse:
+    status = 200
+    data = b"<html><body>ok</body></html>"
+
+class FakeHttp:
+    def __init__(self):
+        self.urls = []
+
+    def request(self, method, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse()
+
+@pytest.fixture
+def client():
+    client = app.ReadOnlyClient("https://www.leitstellenspiel.de")
+    client.http = FakeHttp()
+    client.headers = {"Cookie": "session=secret"}
+    return client
+
+@pytest.mark.parametrize("url", ["/missions/1", "https://www.leitstellenspiel.de/vehicles/2"])
+def test_reads_own_pages(client, url):
+    assert client.get(url) is not None
+    assert client.http.urls == [app.urljoin("https://www.leitstellenspiel.de/", url)]
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/missions/1",
+    "//example.com/missions/1",
+    "http://www.leitstellenspiel.de/missions/1",
+    "https://www.leitstellenspiel.de.example.com/",
+])
+def test_never_sends_the_session_elsewhere(client, url):
+    assert client.get(url) is None
+    assert client.http.urls == []
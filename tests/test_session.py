@@ -0,0 +1,15 @@
+import json
+
+import app
+
+def test_session_cookies_are_private(tmp_path):
+    class FakeDriver:
+        def get_cookies(self):
+            return [{"name": "session", "value": "secret", "domain": "example", "extra": 1}]
+
+    path = tmp_path / "session_cookies.json"
+    (tmp_path / "session_cookies.json.tmp").write_text("stale")
+    (tmp_path / "session_cookies.json.tmp").chmod(0o644)
+    app.save_session(FakeDriver(), str(path))
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert json.loads(path.read_text()) == [{"name": "session", "value": "secret", "domain": "example"}]
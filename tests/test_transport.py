@@ -0,0 +1,49 @@
+import contextlib
+
+import lxml.html
+import pytest
+
+import app
+
+HOSPITAL = app.Hospital("7", "Klinikum", 2.0, 5, True, True, "/vehicles/1/patient/7")
+
+class FakeTabs:
+    def __init__(self, visited):
+        self.visited = visited
+
+    @contextlib.contextmanager
+    def visit(self, role, url):
+        self.visited.append(url)
+        yield
+
+@pytest.fixture
+def transport(monkeypatch):
+    visited = []
+    loaded = []
+    cache = app.HospitalCache(ttl=60)
+    cache.store("42", [HOSPITAL])
+
+    def load_hospital_page(driver, vehicle_url):
+        loaded.append(vehicle_url)
+        # Gefangenentransport: keine Krankenhausliste
+        return lxml.html.fromstring("<html><body><div id='prisoners'></div></body></html>")
+
+    monkeypatch.setattr(app, "HOSPITAL_CACHE", cache)
+    monkeypatch.setattr(app, "load_hospital_page", load_hospital_page)
+    monkeypatch.setattr(app, "tabs_for", lambda driver: FakeTabs(visited))
+    monkeypatch.setattr(app, "wait_for_ready_state", lambda driver: None)
+    monkeypatch.setattr(app, "page_tree", lambda driver: lxml.html.fromstring("<html><body></body></html>"))
+    return visited, loaded
+
+@pytest.mark.parametrize("type_id", [None, "32"])
+def test_unknown_or_non_patient_type_checks_vehicle_page(transport, type_id):
+    visited, loaded = transport
+    assert not app.transport_patient(None, f"{app.BASE_URL}/vehicles/1", type_id, "42")
+    assert loaded == [f"{app.BASE_URL}/vehicles/1"]
+    assert visited == []
+
+def test_patient_type_uses_cached_hospitals(transport):
+    visited, loaded = transport
+    assert app.transport_patient(None, f"{app.BASE_URL}/vehicles/1", "28", "42")
+    assert loaded == []
+    assert visited == [f"{app.BASE_URL}/vehicles/1/patient/7"]
@@ -0,0 +1,64 @@
+from difflib import get_close_matches
+
+import pytest
+
+import app
+
+# Alte smart_vehicle_match vor VehicleResolver, unverändert bis auf die Tabellen aus app
+def baseline_vehicle_match(vehicle_name):
+    if vehicle_name.lower().startswith("hlf"):
+        return "HLF 20"
+    if vehicle_name in app.VEHICLE_MAPPINGS:
+        return app.VEHICLE_MAPPINGS[vehicle_name]
+    vehicle_lower = vehicle_name.lower()
+    for partial, abbrev in app.PARTIAL_MATCHES.items():
+        if partial in vehicle_lower:
+            return abbrev
+    if "-" in vehicle_name:
+        abbrev_parts = vehicle_name.split("-")
+        possible_matches = [v for v in app.VEHICLE_MAPPINGS.values() if v.startswith(abbrev_parts[0])]
+        if possible_matches:
+            return possible_matches[0]
+    possible_matches = get_close_matches(vehicle_name, app.VEHICLE_MAPPINGS.keys(), n=1, cutoff=0.6)
+    if possible_matches:
+        return app.VEHICLE_MAPPINGS[possible_matches[0]]
+    return vehicle_name
+
+NAMES = [
+    # exakt
+    "RTW", "NEF", "NAW", "KTW", "ELW 1", "ELW 2", "ELW 1 (SEG)", "Drehleiter", "GW-L2", "SW 1000",
+    "MzGW (FGr N)", "Feuerwehrkräne (FwK)", "LNA", "OrgL", "KdoW LNA", "FuStW", "Wasserwerfer", "MANV 10",
+    # HLF-Varianten
+    "HLF 20", "HLF 10", "hlf", "HLF20", "Hlf 20/16",
+    # Teilstrings, Reihenfolge von PARTIAL_MATCHES zählt
+    "LF 20", "LF 10", "LF 8/6", "TLF 3000", "TLF 4000", "RW 2", "Rüstwagen-Kran", "DLK 23", "DLA (K) 23/12",
+    "Gerätewagen Gefahrgut", "GW-Atemschutz/Strahlenschutz", "Ölschadenbekämpfung", "Sanitätszug",
+    "Streifenwagen", "GW-Messtechnik 2", "Schlauchwagen", "MTW-OV",
+    # Präfix vor dem Bindestrich
+    "GW-Wasserrettung", "WF-XYZ", "MEK-Fahrzeug", "Pol-Sonder", "AH-Boot", "WR-Boot", "Dekon-X", "G-RTW 2",
+    "SEK-X", "X-Y", "-", "Flgh-Test",
+    # Tippfehler
+    "RTWW", "NEFF", "Mehrzweckkraftwagn", "Tankwgen", "Feuerwehrkran 2", "KdoW OrgLL", "GruKW", "IeBeKW",
+    # unbekannt
+    "", "Unbekanntes Fahrzeug", "Boot", "xyz", "ELW", "MLW 4", "Polizeihubschrauber", "NEA200",
+]
+
+@pytest.mark.parametrize("name", NAMES)
+def test_resolver_matches_baseline(name):
+    resolver = app.VehicleResolver(app.VEHICLE_MAPPINGS, app.PARTIAL_MATCHES)
+    expected = baseline_vehicle_match(name)
+    assert resolver.resolve(name) == expected
+    # zweiter Aufruf kommt aus dem Memo
+    assert resolver.resolve(name) == expected
+    assert resolver.metrics["memo"] == 1
+
+def test_smart_vehicle_match_matches_baseline():
+    for name in NAMES:
+        assert app.smart_vehicle_match(name) == baseline_vehicle_match(name)
+
+def test_memo_eviction_keeps_results():
+    resolver = app.VehicleResolver(app.VEHICLE_MAPPINGS, app.PARTIAL_MATCHES, memo_size=4)
+    for _ in range(2):
+        for name in NAMES:
+            assert resolver.resolve(name) == baseline_vehicle_match(name)
+    assert len(resolver.memo) == 4
@@ -0,0 +1,28 @@
+import app
+
+def aao(**available):
+    return {name: {"attribute": name, "available": count, "success": count > 0} for name, count in available.items()}
+
+def delivered(plan):
+    return sum(app.WATER_CAPACITIES[t] * n for t, n in plan.items())
+
+def test_large_shortfall_is_not_overplanned():
+    plan = app.plan_water_dispatch(4000, aao(**{"GW-L2": 2, "TLF": 2, "LF": 10}))
+    assert delivered(plan) >= 4000
+    # höchstens ein Fahrzeug mehr als nötig
+    assert sum(plan.values()) <= 2
+
+def test_aliased_aao_labels_are_resolved():
+    index = aao(**{"TLF 4000": 1, "GW-L2-Wasser": 1, "HLF 20": 0, "LF 20": 3})
+    plan = app.plan_water_dispatch(7000, index)
+    assert plan == {"TLF": 1, "GW-L2": 1, "LF": 2}
+
+def test_one_aao_label_is_not_planned_twice():
+    # "LF" und "HLF 20" landen beide beim einzigen Label "HLF 20"
+    plan = app.plan_water_dispatch(10000, aao(**{"HLF 20": 2}))
+    assert sum(plan.values()) == 2
+
+def test_water_estimate_uses_selected_vehicles():
+    assert app.water_still_missing(3000, {"LF": 1}) == 3000 - app.WATER_CAPACITIES["LF"]
+    # nichts ausgewählt: der ganze Bedarf bleibt offen
+    assert app.water_still_missing(3000, {}) == 3000
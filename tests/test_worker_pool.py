@@ -0,0 +1,48 @@
+import json
+import threading
+
+import app
+
+def test_workers_do_not_share_the_chrome_profile(monkeypatch):
+    started = []
+
+    def create_driver(settings=None):
+        if settings.get("user_data_dir"):
+            raise RuntimeError("user data directory is already in use")
+        started.append(settings)
+        return object()
+
+    monkeypatch.setenv("CHROME_USER_DATA_DIR", "profile")
+    monkeypatch.setattr(app, "create_driver", create_driver)
+    monkeypatch.setattr(app, "restore_session", lambda driver: True)
+    pool = app.MissionWorkerPool(3)
+    assert pool.size == 3
+    assert len(started) == 3
+    pool.executor.shutdown()
+
+def test_pool_without_browsers_falls_back_to_sequential(monkeypatch):
+    def create_driver(settings=None):
+        raise RuntimeError("chrome failed to start")
+
+    monkeypatch.setattr(app, "create_driver", create_driver)
+    pool = app.MissionWorkerPool(2)
+    assert pool.size == 0
+    pool.close()
+
+def test_metrics_lines_do_not_interleave(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = app.Metrics(str(path))
+
+    def work():
+        for _ in range(500):
+            metrics.record("phase_with_a_rather_long_name", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.file.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 4000
+    assert all(json.loads(line)["phase"] == "phase_with_a_rather_long_name" for line in lines)